@@ -0,0 +1,138 @@
+"""Benchmark the sampling engine on synthetic NetCDF files
+
+Times and records peak (Python-allocated) memory of sample_netcdf, sample_netcdfs and
+sample_nc_dir and compares them with stored baselines:
+
+    python benchmarks/run.py                 # compare with baselines.json
+    python benchmarks/run.py --save          # store results as new baselines
+    python benchmarks/run.py --size large    # larger grids, more files and geometries
+
+Exits with 1 if a case is slower or uses more memory than its baseline allows.
+Baselines are machine dependent, so store them on the machine you compare on.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict
+
+from wiwb.sample import clear_caches, sample_nc_dir, sample_netcdf, sample_netcdfs
+from wiwb.synthetic import synthetic_geometries, write_netcdfs
+
+BASELINES = Path(__file__).parent / "baselines.json"
+STATS = ["mean", "max"]
+
+SIZES = {
+    "small": {"cell_size": 1000, "timesteps": 6, "n_files": 4, "n_geometries": 50, "n_catchments": 200},
+    "large": {"cell_size": 250, "timesteps": 24, "n_files": 30, "n_geometries": 1000, "n_catchments": 5000},
+}
+
+
+def measure(func: Callable, repeat: int = 3) -> Dict[str, float]:
+    """Best time of `repeat` runs and peak memory of a separate traced run"""
+    times = []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    clear_caches()
+    tracemalloc.start()
+    func()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"time": min(times), "peak_memory": peak_memory}
+
+
+def cases(directory: Path, size: str) -> Dict[str, Callable]:
+    """Benchmark cases on synthetic files written to directory"""
+    settings = SIZES[size]
+    nc_files = write_netcdfs(
+        directory,
+        n_files=settings["n_files"],
+        timesteps=settings["timesteps"],
+        cell_size=settings["cell_size"],
+        nodata_fraction=0.01,
+    )
+    geometries = {
+        kind: synthetic_geometries(kind, n=settings["n_geometries"])
+        for kind in ["points", "polygons", "multipolygons"]
+    }
+    geometries["catchments"] = synthetic_geometries("catchments", n=settings["n_catchments"])
+
+    result = {
+        f"sample_netcdf[{kind}]": lambda geometries=geometries[kind]: sample_netcdf(
+            nc_files[0], "P", geometries, STATS
+        )
+        for kind in geometries
+    }
+    result["sample_netcdf[catchments, percentile_90]"] = lambda: sample_netcdf(
+        nc_files[0], "P", geometries["catchments"], ["mean", "percentile_90"]
+    )
+    result["sample_netcdfs[catchments]"] = lambda: sample_netcdfs(nc_files, "P", geometries["catchments"], STATS)
+    result["sample_nc_dir[catchments]"] = lambda: sample_nc_dir(directory, "P", geometries["catchments"], STATS)
+    return result
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baselines: Dict[str, Dict[str, float]],
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> list:
+    """Cases that regressed compared to their baseline"""
+    regressions = []
+    for case, result in results.items():
+        baseline = baselines.get(case)
+        if baseline is None:
+            continue
+        if result["time"] > baseline["time"] * time_tolerance:
+            regressions.append(f"{case}: time {result['time']:.3f}s > baseline {baseline['time']:.3f}s")
+        if result["peak_memory"] > baseline["peak_memory"] * memory_tolerance:
+            regressions.append(
+                f"{case}: peak memory {result['peak_memory'] / 1e6:.1f}MB > "
+                f"baseline {baseline['peak_memory'] / 1e6:.1f}MB"
+            )
+    return regressions
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=list(SIZES), default="small")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, best is reported")
+    parser.add_argument("--save", action="store_true", help="store results as baselines")
+    parser.add_argument("--time-tolerance", type=float, default=1.5)
+    parser.add_argument("--memory-tolerance", type=float, default=1.2)
+    parser.add_argument("--baselines", type=Path, default=BASELINES)
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {}
+        for case, func in cases(Path(tmp_dir), args.size).items():
+            results[case] = measure(func, repeat=args.repeat)
+            print(f"{case:45} {results[case]['time']:8.3f}s {results[case]['peak_memory'] / 1e6:8.1f}MB")
+
+    all_baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+    if args.save:
+        all_baselines[args.size] = {"machine": platform.platform(), "cases": results}
+        args.baselines.write_text(json.dumps(all_baselines, indent=1))
+        print(f"baselines stored in {args.baselines}")
+        return 0
+
+    if args.size not in all_baselines:
+        print(f"no baselines for size {args.size}, store them with --save")
+        return 0
+    regressions = compare(results, all_baselines[args.size]["cases"], args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
 # %%
+from datetime import date
 from pathlib import Path
+from typing import Dict
 
 import pandas as pd
 import pytest
@@ -7,6 +9,7 @@ from geopandas import GeoSeries
 from pandas import DataFrame
 
 from wiwb import Api, Auth
+from wiwb.api_calls import GetGrids
 from wiwb.constants import GEOSERIES, get_defaults
 
 DIR = Path(__file__).parent.joinpath("data")
@@ -54,4 +57,62 @@ def grids_df() -> DataFrame:
     return (df_expected * 100).astype(int)
 
 
-# %%
+@pytest.fixture(scope="session")
+def grids_nc(tmp_path_factory) -> Path:
+    """Synthetic hourly precipitation NetCDF in EPSG:28992 covering the default bounds"""
+    import numpy as np
+    import xarray
+
+    xmin, ymin, xmax, ymax = get_defaults().bounds
+    x = np.arange(xmin, xmax, 1000) + 500
+    y = np.arange(ymax, ymin, -1000) - 500
+    time = pd.date_range("2018-01-01", periods=24, freq="h")
+    values = np.random.default_rng(0).random((len(time), len(y), len(x)))
+    ds = xarray.Dataset(
+        {"P": (("time", "y", "x"), values.astype("float32"))},
+        coords={"time": time, "y": y, "x": x},
+    )
+    nc_file = tmp_path_factory.mktemp("grids") / "grids.nc"
+    ds.to_netcdf(nc_file, encoding={"P": {"_FillValue": -9999.0}})
+    return nc_file
+
+
+@pytest.fixture
+def wiwb_server(grids_nc):
+    """Local stand-in for the WIWB token and API endpoints, serving grids_nc.
+
+    Yields the server, with its base url as attribute `url` and connecting clients in
+    `client_addresses`. Append (status_code, retry_after) tuples to `failures` to fail
+    the next requests.
+    """
+    import xarray
+
+    from wiwb.fake_server import FakeWiwbServer
+
+    with xarray.open_dataset(grids_nc) as ds:
+        dataset = ds.load()
+    with FakeWiwbServer(dataset=dataset) as server:
+        yield server
+
+
+@pytest.fixture
+def local_auth(wiwb_server) -> Auth:
+    return Auth(client_id="test", client_secret="test", url=f"{wiwb_server.url}/token")
+
+
+@pytest.fixture
+def grids_kwargs(geoseries) -> Dict:
+    """Request of a day of grids_nc at the wiwb_server, as GetGrids and get_grids kwargs"""
+    return {
+        "data_source_code": "Meteobase.Precipitation",
+        "variable_code": "P",
+        "start_date": date(2018, 1, 1),
+        "end_date": date(2018, 1, 2),
+        "data_format_code": "netcdf4.cf1p6",
+        "geometries": geoseries,
+    }
+
+
+@pytest.fixture
+def grids(local_auth, wiwb_server, grids_kwargs) -> GetGrids:
+    return GetGrids(auth=local_auth, base_url=wiwb_server.url, **grids_kwargs)
@@ -1,4 +1,9 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from wiwb import Api
 
 CLIENT_ID = os.getenv("wiwb_client_id")
 
@@ -9,3 +14,59 @@ def test_authorization(auth):
 
 def test_wiwb_api(api):
     assert api.auth.client_id == CLIENT_ID
+
+
+def test_api_session(local_auth, wiwb_server):
+    api = Api(auth=local_auth, base_url=wiwb_server.url, pool_size=2, timeout=5)
+
+    # auth and all requests share the pooled session of the api
+    assert api.auth.session is api.session
+
+    # the provided auth is not modified, so two apis sharing it keep their own session
+    assert local_auth.session is not api.session
+    other_api = Api(auth=local_auth, base_url=wiwb_server.url)
+    assert other_api.auth.session is other_api.session
+    assert api.auth.session is api.session
+    assert api.auth.token == local_auth.token
+    assert (
+        api.get_grids(
+            data_source_code="Meteobase.Precipitation",
+            variable_code="P",
+            start_date=date(2018, 1, 1),
+            end_date=date(2018, 1, 2),
+        ).session
+        is api.session
+    )
+
+    wiwb_server.client_addresses.clear()
+    api.auth._get_token()
+    assert "Meteobase.Precipitation" in api.get_data_sources().keys()
+    assert "P" in api.get_variables(data_source_codes=["Meteobase.Precipitation"])
+
+    # all calls re-use one connection
+    assert len(wiwb_server.client_addresses) == 3
+    assert len(set(wiwb_server.client_addresses)) == 1
+
+
+def test_auth_single_flight(local_auth, monkeypatch):
+    assert local_auth.refresh_count == 1
+
+    # valid tokens are not decoded again
+    monkeypatch.setattr("wiwb.auth.jwt.decode", lambda *args, **kwargs: 1 / 0)
+    assert local_auth.headers["Authorization"].startswith("Bearer ")
+    monkeypatch.undo()
+
+    # threads finding an expired token, refresh it only once
+    local_auth._token_expiry = 0
+    barrier = threading.Barrier(8)
+
+    def get_token():
+        barrier.wait()
+        return local_auth.token
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = list(executor.map(lambda _: get_token(), range(8)))
+
+    assert local_auth.refresh_count == 2
+    assert len(set(tokens)) == 1
+    assert local_auth.is_token_valid
@@ -0,0 +1,28 @@
+import asyncio
+
+from wiwb import Api, ThreadedAsyncApi
+
+
+def test_threaded_async_api(local_auth, wiwb_server, grids_kwargs):
+    async def main():
+        async with ThreadedAsyncApi(auth=local_auth, base_url=wiwb_server.url, max_concurrency=3) as api:
+            assert api.session.adapters["http://"]._pool_maxsize == 10
+            grids = [api.get_grids(**grids_kwargs) for _ in range(4)]
+            results = await asyncio.gather(
+                api.get_data_sources(),
+                api.get_variables(data_source_codes=["Meteobase.Precipitation"]),
+                *(i.sample() for i in grids),
+            )
+            await asyncio.gather(*(i.aclose() for i in grids))
+        return api, results
+
+    api, (data_sources, variables, *dfs) = asyncio.run(main())
+
+    # threads are shut down on exit
+    assert api._executor._shutdown
+
+    assert "Meteobase.Precipitation" in data_sources.keys()
+    assert "P" in variables.keys()
+
+    expected = Api(auth=local_auth, base_url=wiwb_server.url).get_grids(**grids_kwargs).sample()
+    assert all(i.equals(expected) for i in dfs)
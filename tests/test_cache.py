@@ -0,0 +1,90 @@
+import os
+import shutil
+import time
+
+from wiwb.api_calls import GetGrids
+from wiwb.cache import GridCache
+
+
+def test_cached_grids(local_auth, wiwb_server, tmp_path, grids_kwargs, grids_nc):
+    cache = GridCache(tmp_path / "cache")
+    kwargs = {**grids_kwargs, "auth": local_auth, "cache": cache}
+
+    # pre-seed cache, so we can sample without a server
+    grids = GetGrids(base_url="http://localhost:1", **kwargs)
+    shutil.copyfile(grids_nc, cache.path(cache.key(grids.url, grids.body.json()), "nc"))
+    df = grids.sample()
+    assert not df.empty
+    assert cache.stats["hits"] == 1
+
+    # a miss downloads into the cache, a hit doesn't touch the server
+    grids = GetGrids(base_url=wiwb_server.url, **kwargs)
+    grids.sample()
+    grids.run()
+    grids.to_directory(tmp_path / "output")
+    assert len(wiwb_server.client_addresses) == 2  # token + grids
+    assert cache.stats["hits"] == 2
+    assert cache.stats["misses"] == 1
+    assert cache.stats["files"] == 2
+    assert grids._file.exists()
+    assert (tmp_path / "output" / grids.file_name).exists()
+
+
+def test_cache_eviction(tmp_path):
+    cache = GridCache(tmp_path, max_size=10)
+    for i, key in enumerate(["a", "b", "c"]):
+        file_path = cache.temp_path(key, "nc")
+        file_path.write_bytes(b"12345")
+        os.utime(file_path, (i, i))
+        cache.put(key, "nc", file_path)
+
+    # least recently used is evicted
+    assert cache.get("a", "nc") is None
+    assert cache.get("b", "nc") is not None
+    assert cache.stats["files"] == 2
+
+    # stale files are not returned
+    cache.ttl = 60
+    os.utime(cache.path("c", "nc"), (time.time(), time.time() - 120))
+    assert cache.get("c", "nc") is None
+    assert cache.stats == {"hits": 1, "misses": 2, "files": 2, "size": 10}
+
+
+def test_cache_ttls(tmp_path):
+    cache = GridCache(tmp_path, ttl=60, ttls={"Knmi.Radar": 10, "Meteobase.Precipitation": None})
+    keys = {
+        code: cache.key("http://localhost", {"Readers": [{"DataSourceCode": code}]})
+        for code in ["Knmi.Radar", "Meteobase.Precipitation", "Other"]
+    }
+    for key in keys.values():
+        file_path = cache.temp_path(key, "nc")
+        file_path.write_bytes(b"12345")
+        cache.put(key, "nc", file_path).unlink()
+        os.utime(cache.path(key, "nc"), (time.time(), time.time() - 30))
+
+    # ttl per data source, else the default ttl
+    assert cache.get(keys["Knmi.Radar"], "nc") is None
+    assert cache.get(keys["Other"], "nc") is not None
+    os.utime(cache.path(keys["Meteobase.Precipitation"], "nc"), (0, 0))
+    assert cache.get(keys["Meteobase.Precipitation"], "nc") is not None
+
+    # eviction keeps files of a data source that are never stale
+    cache.evict()
+    assert cache.path(keys["Meteobase.Precipitation"], "nc").exists()
+    assert not cache.path(keys["Knmi.Radar"], "nc").exists()
+
+
+def test_cache_stable_path(tmp_path):
+    cache = GridCache(tmp_path, max_size=5)
+    file_path = cache.temp_path("a", "nc")
+    file_path.write_bytes(b"12345")
+    link_path = cache.put("a", "nc", file_path)
+
+    # an evicted download stays readable through the link handed out
+    file_path = cache.temp_path("b", "nc")
+    file_path.write_bytes(b"67890")
+    os.utime(cache.path("a", "nc"), (0, 0))
+    cache.put("b", "nc", file_path)
+    assert not cache.path("a", "nc").exists()
+    assert link_path.read_bytes() == b"12345"
+    assert cache.stats["files"] == 1
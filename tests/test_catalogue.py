@@ -0,0 +1,82 @@
+from datetime import date
+
+import pytest
+
+from wiwb import Api
+from wiwb.api_calls import GetGrids
+from wiwb.catalogue import Catalogue
+
+
+def test_catalogue(local_auth, wiwb_server, tmp_path):
+    path = tmp_path / "catalogue.json"
+    catalogue = Catalogue(path)
+    api = Api(auth=local_auth, base_url=wiwb_server.url, catalogue=catalogue)
+    # the provided catalogue is not modified
+    assert (catalogue.auth is None) and (api.catalogue.auth is api.auth)
+    kwargs = {"start_date": date(2018, 1, 1), "end_date": date(2018, 1, 2)}
+
+    assert api.get_data_sources() == wiwb_server.data_sources
+    assert api.catalogue.data_source_codes("Grid") == ["Meteobase.Precipitation"]
+    assert api.catalogue.data_source_codes("TimeSeries") == []
+    assert list(api.get_variables(data_source_codes=["Meteobase.Precipitation"])) == ["P"]
+    api.get_grids(data_source_code="Meteobase.Precipitation", variable_code="P", **kwargs)
+    requests = wiwb_server.stats["requests"]  # token, data sources and variables
+
+    # bad requests fail locally
+    with pytest.raises(ValueError, match="Did you mean \\['Meteobase.Precipitation'\\]"):
+        api.get_grids(data_source_code="Meteobase.Precipitaton", variable_code="P", **kwargs)
+    with pytest.raises(ValueError, match="variable_code Q not in"):
+        api.get_grids(
+            data_source_code=None,
+            variable_code=None,
+            variables={"Meteobase.Precipitation": ["P", "Q"]},
+            **kwargs,
+        )
+    assert wiwb_server.stats["requests"] == requests
+
+    # the catalogue is persistent
+    api = Api(auth=local_auth, base_url=wiwb_server.url, catalogue=Catalogue(path))
+    api.get_grids(data_source_code="Meteobase.Precipitation", variable_code="P", **kwargs)
+    assert wiwb_server.stats["requests"] == requests
+
+    # until refreshed or stale
+    api.catalogue.refresh()
+    assert wiwb_server.stats["requests"] == requests + 1
+    api.catalogue.ttl = 0
+    api.get_variables(data_source_codes=["Meteobase.Precipitation"])
+    assert wiwb_server.stats["requests"] == requests + 3
+
+
+def test_catalogue_get_grids(local_auth, wiwb_server, tmp_path):
+    # a GetGrids with a catalogue is validated without an Api
+    with pytest.raises(ValueError, match="variable_code Q not in"):
+        GetGrids(
+            base_url=wiwb_server.url,
+            auth=local_auth,
+            data_source_code="Meteobase.Precipitation",
+            variable_code="Q",
+            start_date=date(2018, 1, 1),
+            end_date=date(2018, 1, 2),
+            catalogue=Catalogue(tmp_path / "catalogue.json"),
+        )
+
+
+def test_catalogue_save_merges(local_auth, wiwb_server, tmp_path):
+    path = tmp_path / "catalogue.json"
+    catalogue = Catalogue(path).bind(wiwb_server.url, local_auth)
+    other = Catalogue(path).bind(wiwb_server.url, local_auth)
+    catalogue.data_sources()
+    other.data_sources()
+    catalogue.variables("Meteobase.Precipitation")
+
+    # saving other keeps the variables saved by catalogue
+    other.save()
+    saved = Catalogue(path).bind(wiwb_server.url, local_auth)
+    requests = wiwb_server.stats["requests"]
+    assert list(saved.variables("Meteobase.Precipitation")) == ["P"]
+    assert wiwb_server.stats["requests"] == requests
+
+    # a refresh drops the variables, also of the other process
+    other.refresh()
+    catalogue.save()
+    assert "Meteobase.Precipitation" not in Catalogue(path)._read()[wiwb_server.url]["variables"]
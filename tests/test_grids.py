@@ -1,15 +1,17 @@
 # %%
-from datetime import date
+from datetime import date, datetime
 
+import numpy as np
+import pandas as pd
 import pytest
 
+from wiwb import Auth
 from wiwb.api_calls import GetGrids
 
-from wiwb import Api, Auth
 
 def test_grids(auth, api, tmp_path, geoseries, grids_df):
     """
-    note WIWB does guarantee you get all data within bounds. Therefore other_point will be outside
+    Note WIWB does guarantee you get all data within bounds. Therefore other_point will be outside
     bounds and result is None :-(
 
     """
@@ -32,14 +34,12 @@ def test_grids(auth, api, tmp_path, geoseries, grids_df):
 
     # check write to disck
     grids.to_directory(tmp_path)
-    assert tmp_path.joinpath(
-        "Meteobase.Precipitation_P_2018-01-01_2018-01-02.nc"
-    ).exists()
+    assert tmp_path.joinpath("Meteobase.Precipitation_P_2018-01-01_2018-01-02.nc").exists()
 
 
 def test_reproject(auth, api, geoseries):
     """
-    note WIWB does guarantee you get all data within bounds. Therefore other_point will be outside
+    Note WIWB does guarantee you get all data within bounds. Therefore other_point will be outside
     bounds and result is None :-(
 
     """
@@ -79,9 +79,7 @@ def test_bounds(auth, api, defaults):
     assert grids.bbox == defaults.bounds
 
     # setting bounds to None should result in ValueError ("Specify either 'geometries' or 'bounds', both are None")
-    with pytest.raises(
-        ValueError, match="Specify either 'geometries' or 'bounds', both are None"
-    ):
+    with pytest.raises(ValueError, match="Specify either 'geometries' or 'bounds', both are None"):
         grids.set_bounds(None)
 
     # setting geometries
@@ -89,3 +87,139 @@ def test_bounds(auth, api, defaults):
     grids.set_bounds(None)
 
     assert grids.bbox == tuple(defaults.geoseries.total_bounds)
+
+
+def test_grids_stream(local_auth, wiwb_server, tmp_path, grids_kwargs):
+    kwargs = {"auth": local_auth, "base_url": wiwb_server.url, **grids_kwargs}
+    progress = []
+    grids = GetGrids(**kwargs, stream=True, download_chunk_size=1024, progress_callback=progress.append)
+    grids.run()
+
+    # content is streamed to a file, in chunks
+    assert grids._response is None
+    assert grids._file.exists()
+    assert progress == sorted(progress)
+    assert progress[-1] == grids._file.stat().st_size
+
+    # the file of a previous run is deleted on re-run
+    tmp_file = grids._file
+    grids.run()
+    assert not tmp_file.exists()
+
+    # the file is kept for sampling and writing again, until closed
+    tmp_file = grids._file
+    requests = wiwb_server.stats["requests"]
+    df = grids.sample(stats=["mean", "max"])
+    grids.to_directory(tmp_path / "output")
+    assert grids.sample(stats=["mean", "max"]).equals(df)
+    assert wiwb_server.stats["requests"] == requests
+    grids.close()
+    assert not tmp_file.exists()
+    assert grids._file is None
+
+    # or garbage-collected
+    grids.run()
+    tmp_file = grids._file
+    del grids
+    assert not tmp_file.exists()
+
+    # streamed result equals buffered result
+    assert df.equals(GetGrids(**kwargs).sample(stats=["mean", "max"]))
+
+    # stream directly to output directory
+    grids = GetGrids(**kwargs, stream=True)
+    grids.to_directory(tmp_path)
+    assert grids._file == tmp_path.joinpath("Meteobase.Precipitation_P_2018-01-01_2018-01-02.nc")
+    assert grids._file.stat().st_size == progress[-1]
+    grids.sample(stats=["mean", "max"])
+    assert grids._file.exists()  # output files are kept
+
+
+def test_grids_time_window(grids, tmp_path, grids_kwargs):
+    expected = GetGrids(auth=grids.auth, base_url=grids.base_url, **grids_kwargs)
+    grids.time_window = "6h"
+    grids.max_workers = 2
+
+    # 4 chunks of 6 hours
+    chunks = grids.chunks()
+    assert len(chunks) == 4
+    assert chunks[0].start_date == date(2018, 1, 1)
+    assert chunks[-1].end_date == date(2018, 1, 2)
+    # chunks end one interval before the next starts, so no timestep is requested twice
+    assert all(
+        pd.Timestamp(i.end_date) + pd.Timedelta(hours=1) == pd.Timestamp(j.start_date)
+        for i, j in zip(chunks[:-1], chunks[1:])
+    )
+
+    # merged chunks equal one request
+    df = grids.sample(stats=["mean", "max"])
+    assert df.index.is_unique and df.index.is_monotonic_increasing
+    assert df.equals(expected.sample(stats=["mean", "max"]))
+
+    # chunks follow changes after a run
+    grids.end_date = datetime(2018, 1, 1, 12)
+    assert not grids.is_downloaded
+    assert grids.sample(stats=["mean", "max"]).equals(df.loc[: grids.end_date])
+    assert len(grids._chunks) == 2
+
+    # one file per chunk
+    grids.end_date = date(2018, 1, 2)
+    grids.time_window = "12h"
+    grids.stream = True
+    grids.to_directory(tmp_path)
+    assert len(list(tmp_path.glob("*.nc"))) == 2
+
+
+@pytest.mark.parametrize("data_format_code", ["geotiff", "netcdf4.cf1p6.zip"])
+def test_grids_zip(grids, grids_kwargs, wiwb_server, tmp_path, data_format_code):
+    grids.data_format_code = data_format_code
+    df = grids.sample(stats=["mean", "max"])
+
+    # sampled without switching to netcdf, so with one download
+    assert grids.data_format_code == data_format_code
+    assert len(wiwb_server.client_addresses) == 2  # token + grids
+    expected = GetGrids(auth=grids.auth, base_url=grids.base_url, **grids_kwargs).sample(stats=["mean", "max"])
+    assert df.index.equals(expected.index)
+    assert np.allclose(df, expected, equal_nan=True)
+
+    # archive is written as is, or extracted in output directory
+    grids.to_directory(tmp_path / "zip")
+    assert [i.name for i in tmp_path.joinpath("zip").iterdir()] == [grids.file_name]
+    grids.unzip = True
+    grids.to_directory(tmp_path)
+    assert not tmp_path.joinpath(grids.file_name).exists()
+    assert len(list(tmp_path.glob("*.*"))) == (24 if data_format_code == "geotiff" else 1)
+
+
+@pytest.mark.parametrize("data_format_code", ["netcdf4.cf1p6", "geotiff"])
+def test_grids_variables(geoseries, data_format_code):
+    from wiwb.fake_server import FakeWiwbServer
+    from wiwb.synthetic import synthetic_dataset
+
+    dataset = synthetic_dataset("P", timesteps=24)
+    dataset["E"] = dataset["P"] * 2
+    with FakeWiwbServer(dataset=dataset) as server:
+        auth = Auth(client_id="test", client_secret="test", url=f"{server.url}/token")
+        kwargs = {
+            "auth": auth,
+            "base_url": server.url,
+            "data_source_code": "Meteobase.Precipitation",
+            "variable_code": "P",
+            "start_date": date(2018, 1, 1),
+            "end_date": date(2018, 1, 2),
+            "data_format_code": data_format_code,
+            "geometries": geoseries,
+        }
+        grids = GetGrids(
+            **kwargs,
+            variables={"Meteobase.Precipitation": ["P"], "Meteobase.Evaporation": ["E"]},
+        )
+        df = grids.sample(stats=["mean", "max"])
+        expected = GetGrids(**kwargs).sample(stats=["mean", "max"])
+        assert server.stats["requests"] == 3  # token + one request for both variables
+
+    assert [i.data_source_code for i in grids.body.readers] == ["Meteobase.Precipitation", "Meteobase.Evaporation"]
+    assert grids.file_name.startswith("Meteobase.Precipitation_Meteobase.Evaporation_P_E_")
+    assert df.columns.names == ["variable", "index", "stats"]
+    assert df["P"].equals(expected)
+    assert np.allclose(df["E"], expected * 2, equal_nan=True)
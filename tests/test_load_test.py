@@ -0,0 +1,30 @@
+from wiwb import Api, Auth
+from wiwb.fake_server import FakeWiwbServer
+from wiwb.load_test import run_load_test
+
+
+def test_load_test():
+    with FakeWiwbServer(latency=0.01, seed=0) as server:
+        auth = Auth(client_id="test", client_secret="test", url=f"{server.url}/token")
+        api = Api(auth=auth, base_url=server.url, pool_size=4, backoff_factor=0.01, max_retries=10)
+        server.error_rate = 0.5
+
+        result = run_load_test(api, "grids", requests=8, concurrency=4, hours=6)
+
+    assert result["errors"] == 0
+    assert api.session.stats["retries"] == server.stats["errors"] > 0
+    assert 0 < result["bytes"] <= server.stats["bytes_sent"]
+    assert 0.01 <= result["p50_latency"] <= result["p99_latency"]
+    assert result["requests_per_second"] > 0
+
+
+def test_fake_server_bandwidth():
+    with FakeWiwbServer(bandwidth=1e6) as server:
+        auth = Auth(client_id="test", client_secret="test", url=f"{server.url}/token")
+        api = Api(auth=auth, base_url=server.url)
+
+        result = run_load_test(api, "grids", requests=2, concurrency=1, hours=24)
+
+    # two grids of ~170kB at 1MB/s
+    assert result["bytes_per_second"] <= 1e6
+    assert result["seconds"] >= result["bytes"] / 1e6
@@ -0,0 +1,69 @@
+import json
+import logging
+
+import numpy as np
+import pytest
+from affine import Affine
+from geopandas import GeoSeries
+from shapely.geometry import box
+
+from wiwb import Auth, metrics
+from wiwb.api_calls import GetGrids
+from wiwb.sample import sample_grids
+
+
+@pytest.fixture
+def phases():
+    phases = []
+    metrics.enable(phases.append)
+    yield phases
+    metrics.disable()
+    metrics.registry.reset()
+
+
+def test_metrics(wiwb_server, grids_kwargs, phases, caplog):
+    auth = Auth(client_id="test", client_secret="test", url=f"{wiwb_server.url}/token")
+    progress = []
+    grids = GetGrids(
+        auth=auth,
+        base_url=wiwb_server.url,
+        **grids_kwargs,
+        stream=True,
+        progress_callback=progress.append,
+    )
+    metrics.registry.callbacks.append(metrics.LogExporter())
+    with caplog.at_level(logging.INFO, logger="wiwb.metrics"):
+        df = grids.sample(stats="mean")
+
+    names = [i.name for i in phases]
+    assert names == ["auth.token", "reproject", "grids.response", "grids.transfer", "sample.decode", "sample.zonal"]
+
+    transfer = phases[names.index("grids.transfer")]
+    assert transfer.bytes == progress[-1]
+    zonal = phases[names.index("sample.zonal")]
+    decode = phases[names.index("sample.decode")]
+    assert zonal.cells == decode.cells == decode.bytes / 4  # float32 grids
+    assert zonal.cells % len(df) == 0
+    assert zonal.geometries == len(grids_kwargs["geometries"])
+    assert zonal.geometries_per_second > 0
+
+    # totals per phase and structured logs
+    assert metrics.registry.summary().loc["sample.zonal", "calls"] == 1
+    assert json.loads(caplog.records[-1].message)["name"] == "sample.zonal"
+    assert caplog.records[-1].wiwb_metrics["cells"] == zonal.cells
+
+
+def test_metrics_disabled():
+    assert not metrics.registry.enabled
+    with metrics.phase("sample.zonal") as phase:
+        phase.add(bytes=1)
+    assert metrics.registry.totals == {}
+
+
+def test_metrics_zonal_window(phases):
+    # only cells of the window covering the geometries are counted
+    values = np.zeros((2, 100, 100), dtype="float32")
+    geometries = GeoSeries([box(0, 90, 10, 100)])
+    sample_grids(values, geometries, Affine(1, 0, 0, 0, -1, 100), nodata=-999)
+    assert [i.name for i in phases] == ["sample.zonal"]
+    assert 0 < phases[0].cells < values.size
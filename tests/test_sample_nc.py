@@ -1,7 +1,27 @@
+import io
+import os
+import shutil
+import zipfile
 from datetime import date
 from pathlib import Path
 
-from wiwb.sample import sample_nc_dir
+import numpy as np
+import pandas as pd
+import pytest
+
+import wiwb.netcdf
+import wiwb.sample
+from wiwb.netcdf import file_time_index, open_netcdf, read_header
+from wiwb.sample import (
+    clear_caches,
+    sample_grids,
+    sample_nc_dir,
+    sample_netcdf,
+    sample_netcdfs,
+    sample_zip,
+)
+from wiwb.sinks import ParquetSink
+from wiwb.synthetic import synthetic_geometries, write_netcdfs
 
 START_DATE = date(2015, 1, 1)
 END_DATE = date(2015, 1, 2)
@@ -18,3 +38,252 @@ def test_sample_nc_dir(geoseries, nc_df):
 
     assert not df.empty
     assert (df * 100).astype(int).equals(nc_df)
+
+
+def test_sample_nc_dir_parallel(geoseries, nc_df):
+    dir = DIR.joinpath("DRZSM-AMSR2-C1N-DESC-T10_V003_100")
+
+    df = sample_nc_dir(dir, dir.name, geoseries, STATS, START_DATE, END_DATE, n_workers=2)
+
+    assert (df * 100).astype(int).equals(nc_df)
+
+
+def test_sample_nc_dir_time_pushdown(geoseries, monkeypatch):
+    variable = "DRZSM-AMSR2-C1N-DESC-T10_V003_100"
+    nc_files = sorted(DIR.joinpath(variable).glob("*.nc"))
+
+    # files are selected by the timestamps in their names, before opening any of them
+    index = file_time_index(nc_files, variable)
+    assert list(index["start"]) == list(pd.date_range("2015-01-01", periods=6))
+    assert index["end"].iloc[-1] == pd.Timestamp("2015-01-06")
+
+    opened = []
+
+    def open_netcdf_spy(source, *args, **kwargs):
+        opened.append(Path(source).name)
+        return open_netcdf(source, *args, **kwargs)
+
+    monkeypatch.setattr(wiwb.sample, "open_netcdf", open_netcdf_spy)
+
+    # only a start_date selects until the end
+    df = sample_nc_dir(DIR.joinpath(variable), variable, geoseries, STATS, start_date=date(2015, 1, 5))
+    assert list(df.index) == list(pd.date_range("2015-01-05", periods=2))
+    assert sorted(opened) == [i.name for i in nc_files[-2:]]
+
+    # only an end_date selects from the start
+    df = sample_nc_dir(DIR.joinpath(variable), variable, geoseries, STATS, end_date=date(2015, 1, 1))
+    assert list(df.index) == [pd.Timestamp("2015-01-01")]
+
+
+def test_read_header():
+    nc_file = sorted(DIR.joinpath("DRZSM-AMSR2-C1N-DESC-T10_V003_100").glob("*.nc"))[0]
+    header = read_header(nc_file, "DRZSM-AMSR2-C1N-DESC-T10_V003_100")
+
+    assert header.crs.to_epsg() == 4326
+    assert header.shape == (302, 988)
+    assert header.start == header.end == pd.Timestamp("2015-01-01")
+    assert header.fill_value == -32768
+
+    # headers are cached per file
+    assert read_header(str(nc_file), "DRZSM-AMSR2-C1N-DESC-T10_V003_100") is header
+
+    # until the caches are cleared
+    clear_caches()
+    assert read_header(nc_file, "DRZSM-AMSR2-C1N-DESC-T10_V003_100") is not header
+
+
+def test_sample_netcdf_in_memory(geoseries, monkeypatch):
+    variable = "DRZSM-AMSR2-C1N-DESC-T10_V003_100"
+    nc_file = sorted(DIR.joinpath(variable).glob("*.nc"))[0]
+    geoseries = geoseries.to_crs(4326)
+
+    # content is parsed once
+    opened = []
+
+    def open_netcdf_spy(source):
+        opened.append(source)
+        return open_netcdf(source)
+
+    monkeypatch.setattr(wiwb.sample, "open_netcdf", open_netcdf_spy)
+    monkeypatch.setattr(wiwb.netcdf, "open_netcdf", open_netcdf_spy)
+    df = sample_netcdf(nc_file.read_bytes(), variable, geoseries, STATS)
+    assert len(opened) == 1
+
+    assert df.equals(sample_netcdf(nc_file, variable, geoseries, STATS))
+
+
+def test_sample_nc_dir_parquet(geoseries, nc_df, tmp_path):
+    dir = DIR.joinpath("DRZSM-AMSR2-C1N-DESC-T10_V003_100")
+
+    sink = sample_nc_dir(dir, dir.name, geoseries, STATS, START_DATE, END_DATE, sink=ParquetSink(tmp_path))
+
+    assert sink.rows_written == len(nc_df.index) * len(nc_df.columns)
+    assert (sink.read() * 100).astype(int).equals(nc_df)
+
+
+def test_sample_nc_dir_incremental(geoseries, nc_df, tmp_path, monkeypatch):
+    variable = "DRZSM-AMSR2-C1N-DESC-T10_V003_100"
+    dir = tmp_path / variable
+    shutil.copytree(DIR.joinpath(variable), dir)
+    output = tmp_path / "samples.parquet"
+
+    sampled = []
+
+    def sample_netcdfs_spy(nc_files, *args, **kwargs):
+        sampled.append(sorted(i.name for i in nc_files))
+        return sample_netcdfs(nc_files, *args, **kwargs)
+
+    monkeypatch.setattr(wiwb.sample, "sample_netcdfs", sample_netcdfs_spy)
+
+    df = sample_nc_dir(dir, variable, geoseries, STATS, START_DATE, END_DATE, output=output)
+    assert (df * 100).astype(int).equals(nc_df)
+    assert output.with_name("samples.parquet.manifest.json").exists()
+
+    # nothing changed, so nothing to sample
+    df = sample_nc_dir(dir, variable, geoseries, STATS, START_DATE, END_DATE, output=output)
+    assert len(sampled) == 1
+    assert (df * 100).astype(int).equals(nc_df)
+
+    # only the touched file is sampled again
+    nc_file = sorted(dir.glob("*.nc"))[0]
+    os.utime(nc_file, ns=(nc_file.stat().st_atime_ns, nc_file.stat().st_mtime_ns + 10**9))
+    df = sample_nc_dir(dir, variable, geoseries, STATS, START_DATE, END_DATE, output=output)
+    assert sampled[-1] == [nc_file.name]
+    assert (df * 100).astype(int).equals(nc_df)
+
+    # a touched file outside start_date and end_date is not
+    nc_file = sorted(dir.glob("*.nc"))[-1]
+    os.utime(nc_file, ns=(nc_file.stat().st_atime_ns, nc_file.stat().st_mtime_ns + 10**9))
+    sample_nc_dir(dir, variable, geoseries, STATS, START_DATE, END_DATE, output=output)
+    assert len(sampled) == 2
+
+    # other stats sample all files again
+    sample_nc_dir(dir, variable, geoseries, "mean", START_DATE, END_DATE, output=output)
+    assert len(sampled[-1]) == len(sampled[0])
+
+
+def test_sample_netcdf_memory_budget(tmp_path, monkeypatch):
+    nc_file = write_netcdfs(tmp_path, n_files=1, timesteps=10, nodata_fraction=0.1)[0]
+    geometries = pd.concat([synthetic_geometries("points", n=10), synthetic_geometries("polygons", n=10, seed=1)])
+    stats = ["mean", "max"]
+    expected = sample_netcdf(nc_file, "P", geometries, stats)
+
+    # 10 grids of 29 x 60 float32 in blocks of 3 timesteps
+    blocks = []
+
+    def sample_grids_spy(values, *args, **kwargs):
+        blocks.append(len(values))
+        return sample_grids(values, *args, **kwargs)
+
+    monkeypatch.setattr(wiwb.sample, "sample_grids", sample_grids_spy)
+    df = sample_netcdf(nc_file, "P", geometries, stats, memory_budget=6 * 29 * 60 * 4)
+
+    assert blocks == [3, 3, 3, 1]
+    assert df.equals(expected)
+
+    # a sink is written per block
+    geometries = geometries.reset_index(drop=True)
+    sink = ParquetSink(tmp_path / "samples", partition_cols=[])
+    written = []
+
+    def write_spy(df, stats):
+        written.append(len(df))
+        ParquetSink.write(sink, df, stats)
+
+    monkeypatch.setattr(sink, "write", write_spy)
+    sample_netcdf(nc_file, "P", geometries, stats, memory_budget=6 * 29 * 60 * 4, sink=sink)
+    assert written == [3, 3, 3, 1]
+    assert sink.read().equals(sample_netcdf(nc_file, "P", geometries, stats))
+
+
+def test_sample_netcdf_window(tmp_path, monkeypatch):
+    nc_file = write_netcdfs(tmp_path, n_files=1, timesteps=2)[0]
+    geometries = synthetic_geometries("polygons", n=5, bounds=(109950, 438940, 119950, 448940))
+
+    shapes = []
+
+    def sample_grids_spy(values, *args, **kwargs):
+        shapes.append(values.shape)
+        return sample_grids(values, *args, **kwargs)
+
+    monkeypatch.setattr(wiwb.sample, "sample_grids", sample_grids_spy)
+    df = sample_netcdf(nc_file, "P", geometries, ["mean", "max"])
+
+    # only a window of at most 10km plus a cell margin of the 29 x 60 grid is read
+    assert len(shapes) == 1
+    assert (shapes[0][1] <= 12) and (shapes[0][2] <= 12)
+    assert df.notna().all().all()
+
+
+def test_sample_zip_variable_prefix(geoseries):
+    from wiwb.fake_server import FakeWiwbServer
+    from wiwb.synthetic import synthetic_dataset
+
+    dataset = synthetic_dataset("P", timesteps=2)
+    dataset["Pa"] = dataset["P"] * 10
+    settings = {"StartDate": "20180101000000", "EndDate": "20180101010000"}
+    with FakeWiwbServer(dataset=dataset) as server:
+        content = {
+            code: server.grids(
+                {
+                    "Readers": [{"Settings": {**settings, "VariableCodes": list(code)}}],
+                    "Exporter": {"DataFormatCode": "geotiff"},
+                }
+            )
+            for code in [("P", "Pa"), ("P",)]
+        }
+
+    df = sample_zip(content["P", "Pa"], ["P", "Pa"], geoseries, stats=["mean"])
+    expected = sample_zip(content["P",], "P", geoseries, stats=["mean"])
+    assert len(expected) == 2
+    assert df["P"].equals(expected)
+    assert df["Pa"].equals(sample_zip(content["P", "Pa"], "Pa", geoseries, stats=["mean"]))
+    assert np.allclose(df["Pa"], expected * 10)
+    assert sample_zip(content["P", "Pa"], "P", geoseries, stats=["mean"]).equals(expected)
+    with pytest.raises(ValueError, match="No NetCDF or GeoTIFF files for Q"):
+        sample_zip(content["P",], ["P", "Q"], geoseries, stats=["mean"])
+
+    # GeoTIFFs without a variable in their name hold the one variable requested
+    renamed = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(content["P",])) as src, zipfile.ZipFile(renamed, "w") as dst:
+        for member in src.namelist():
+            dst.writestr(member.replace("P_", "grid_"), src.read(member))
+    assert sample_zip(renamed.getvalue(), "P", geoseries, stats=["mean"]).equals(expected)
+
+
+def test_sample_netcdf_variables_grids(geoseries, tmp_path):
+    from wiwb.synthetic import synthetic_dataset
+
+    dataset = synthetic_dataset("P", timesteps=2)
+    dataset["E"] = synthetic_dataset("E", cell_size=2000, timesteps=2)["E"].rename(x="x_e", y="y_e")
+    nc_file = tmp_path / "grids.nc"
+    dataset.to_netcdf(nc_file)
+
+    assert sample_netcdf(nc_file, "P", geoseries).notna().all().all()
+    with pytest.raises(ValueError, match="P and E are on different grids"):
+        sample_netcdf(nc_file, ["P", "E"], geoseries)
+
+
+def test_parquet_sink_geometry_dtype(tmp_path):
+    nc_file = write_netcdfs(tmp_path / "nc", n_files=1, timesteps=2)[0]
+    geometries = synthetic_geometries("polygons", n=4).reset_index(drop=True)
+
+    for name, stats in {"single_stat": "mean", "multiple_stats": ["mean", "max"]}.items():
+        df = sample_netcdf(nc_file, "P", geometries, stats)
+        sink = ParquetSink(tmp_path / name)
+        sink.write(df, stats)
+        result = sink.read()
+        assert list(result.columns.get_level_values(0).unique()) == [0, 1, 2, 3]
+        assert result.equals(df)
+
+
+def test_name_to_timestamp():
+    from datetime import datetime
+
+    from wiwb.converters import name_to_timestamp, name_to_timestamps
+
+    # GeoTIFF members and file pruning take the first timestamp of a name
+    name = "P_20180101_20180102000000.tif"
+    assert name_to_timestamps(name) == [datetime(2018, 1, 1), datetime(2018, 1, 2)]
+    assert name_to_timestamp(name) == datetime(2018, 1, 1)
+    assert name_to_timestamp("P.tif") is None
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+import requests
+
+from wiwb import Api
+from wiwb.session import RateLimiter, Session
+
+
+def test_retries(local_auth, wiwb_server):
+    api = Api(auth=local_auth, base_url=wiwb_server.url, backoff_factor=0.01)
+
+    # failures are retried, honouring Retry-After
+    wiwb_server.failures += [(503, None), (429, "0.1"), (502, None)]
+    assert "Meteobase.Precipitation" in api.get_data_sources().keys()
+    assert api.session.stats["retries"] == 3
+    assert api.session.stats["retry_wait"] >= 0.1
+
+    # after max_retries the error is raised
+    wiwb_server.failures += [(500, None)] * 4
+    with pytest.raises(requests.HTTPError):
+        api.get_data_sources()
+    assert api.session.stats["retries"] == 6
+
+
+def test_retry_after_max(local_auth, wiwb_server):
+    session = Session(backoff_max=0.1)
+    api = Api(auth=local_auth, base_url=wiwb_server.url, session=session)
+
+    # a Retry-After longer than backoff_max waits backoff_max
+    wiwb_server.failures += [(429, "3600")]
+    assert "Meteobase.Precipitation" in api.get_data_sources().keys()
+    assert session.stats["retries"] == 1
+    assert session.stats["retry_wait"] == 0.1
+
+
+def test_rate_limit(local_auth, wiwb_server):
+    api = Api(auth=local_auth, base_url=wiwb_server.url, rate_limit=20)
+    start = time.monotonic()
+    for _ in range(6):
+        api.get_variables(data_source_codes=["Meteobase.Precipitation"])
+
+    # 6 requests at 20/s take at least 5 * 0.05s
+    assert time.monotonic() - start >= 0.25
+    assert api.session.stats["requests"] == 6
+    assert api.session.stats["rate_limit_wait"] > 0
+
+
+def test_rate_limiter():
+    rate_limiter = RateLimiter(rate=100, burst=5)
+
+    start = time.monotonic()
+    waits = [rate_limiter.acquire() for _ in range(10)]
+
+    assert waits[:5] == [0] * 5
+    assert time.monotonic() - start >= 0.045
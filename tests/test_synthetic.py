@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+
+from wiwb.netcdf import read_header
+from wiwb.sample import sample_nc_dir
+from wiwb.synthetic import GEOMETRY_KINDS, synthetic_geometries, write_netcdfs
+
+
+def test_write_netcdfs(tmp_path):
+    nc_files = write_netcdfs(tmp_path, n_files=2, timesteps=3, cell_size=2000)
+
+    assert nc_files[0].name == "P_2018-01-01T000000_109950_467600_169430_438940.nc"
+    header = read_header(nc_files[1], "P")
+    assert header.crs.to_epsg() == 28992
+    assert header.shape == (15, 30)
+    assert header.start == pd.Timestamp("2018-01-01 03:00")
+
+
+@pytest.mark.parametrize("kind", GEOMETRY_KINDS)
+def test_sample_synthetic_geometries(tmp_path, kind):
+    write_netcdfs(tmp_path, n_files=2, timesteps=3)
+    geometries = synthetic_geometries(kind, n=20)
+
+    df = sample_nc_dir(tmp_path, "P", geometries, "mean")
+
+    assert df.shape == (6, 20)
+    assert df.notna().all().all()
@@ -0,0 +1,117 @@
+import numpy as np
+from affine import Affine
+from geopandas import GeoSeries
+from shapely.geometry import Point, box
+
+import wiwb.sample
+from wiwb.sample import sample_geoseries, sample_grids
+from wiwb.tiles import CELL_BYTES, sample_tiled, tiled_min_cells
+from wiwb.zonal import geometry_window, get_zonal_weights, grouped_stats
+
+AFFINE = Affine(10, 0, 0, 0, -10, 100)
+GEOMETRIES = GeoSeries(
+    [Point(15, 85), Point(150, 50), box(12, 12, 58, 48), box(-20, 60, 30, 120)],
+    index=["point", "outside", "polygon", "partly_outside"],
+)
+STATS = ["mean", "count", "sum", "min", "max", "percentile_50", "range"]
+
+
+def test_sample_grids():
+    values = np.random.default_rng(0).random((3, 10, 10))
+    values[1, 1, 1] = np.nan
+    values[2, 5, 5] = -999
+
+    result = sample_grids(values, GEOMETRIES, AFFINE, nodata=-999, stats=STATS)
+    expected = np.array(
+        [sample_geoseries(i, GEOMETRIES, AFFINE, nodata=-999, stats=STATS) for i in values],
+        dtype=float,
+    )
+
+    assert np.allclose(result, expected, equal_nan=True)
+
+
+def test_zonal_weights_cached():
+    weights = get_zonal_weights(GEOMETRIES, AFFINE, (10, 10))
+    assert get_zonal_weights(GEOMETRIES.copy(), AFFINE, (10, 10)) is weights
+    assert weights.matrix.shape == (4, 100)
+    assert weights.matrix[1].nnz == 0
+
+
+def test_geometry_window():
+    geometries = GeoSeries([Point(15, 85), box(22, 52, 38, 68)])
+
+    assert geometry_window(geometries, AFFINE, (10, 10)) == (slice(0, 6), slice(0, 5))
+    assert geometry_window(geometries, AFFINE, (10, 10), margin=0) == (slice(1, 5), slice(1, 4))
+    assert geometry_window(GeoSeries([Point(150, 50)]), AFFINE, (10, 10)) is None
+
+    # sampling the window equals sampling the whole grid
+    values = np.random.default_rng(0).random((2, 10, 10))
+    result = sample_grids(values, geometries, AFFINE, nodata=-999, stats=STATS)
+    expected = np.array(
+        [sample_geoseries(i, geometries, AFFINE, nodata=-999, stats=STATS) for i in values],
+        dtype=float,
+    )
+    assert np.allclose(result, expected, equal_nan=True)
+
+
+def test_sample_tiled(monkeypatch):
+    values = np.random.default_rng(0).integers(0, 5, (2, 10, 10)).astype(float)
+    values[0, 5, 5] = np.nan
+    values[1, 2, 2] = -999
+    geometries = GeoSeries(
+        [*GEOMETRIES, box(0, 0, 100, 100), box(41, 41, 49, 49)],
+        index=[*GEOMETRIES.index, "grid", "one_cell"],
+    )
+    stats = STATS + ["median", "std", "majority", "minority", "unique", "nodata"]
+
+    # tiles of 3 x 3 cells, so most geometries span tiles
+    result = sample_grids(values, geometries, AFFINE, nodata=-999, stats=stats, tile_size=3, n_workers=2)
+    expected = np.array(
+        [sample_geoseries(i, geometries, AFFINE, nodata=-999, stats=stats) for i in values],
+        dtype=float,
+    )
+
+    assert np.allclose(result, expected, equal_nan=True)
+
+    # a memory_budget too small for one grouped reduction samples in tiles
+    calls = []
+
+    def spy(*args, **kwargs):
+        calls.append(kwargs)
+        return sample_tiled(*args, **kwargs)
+
+    monkeypatch.setattr(wiwb.sample, "sample_tiled", spy)
+    assert tiled_min_cells(1024) == 1024 // CELL_BYTES
+    result = sample_grids(values, geometries, AFFINE, nodata=-999, stats=stats, memory_budget=1024)
+    assert len(calls) == 1
+    assert np.allclose(result, expected, equal_nan=True)
+
+
+def test_grouped_stats():
+    values = np.array([[1, 3, 3, 1, -999, np.nan, 7, 2], [2, 2, 2, 1, 1, 1, 4, 6]], dtype=float)
+    indptr = np.array([0, 4, 6, 6, 8])  # groups of 4, 2, 0 and 2 cells
+    indices = np.array([0, 1, 2, 3, 4, 5, 6, 7])
+    stats = ["count", "min", "median", "percentile_25", "majority", "minority", "unique", "nodata"]
+
+    result = grouped_stats(values, indptr, indices, nodata=-999, stats=stats)
+    assert result.shape == (2, 4, len(stats))
+    assert np.array_equal(result[0, 0], [4, 1, 2, 1, 1, 1, 2, 0])  # ties resolve to the smallest value
+    assert np.allclose(result[0, 1], [0, *[np.nan] * 6, 1], equal_nan=True)
+    assert np.allclose(result[0, 2], [0, *[np.nan] * 6, 0], equal_nan=True)
+    assert np.array_equal(result[1, 0], [4, 1, 2, 1.75, 2, 1, 2, 0])
+    assert np.array_equal(result[1, 3], [2, 4, 5, 4.5, 4, 4, 2, 0])
+
+
+def test_sample_grids_grouped():
+    values = np.random.default_rng(1).integers(0, 4, (3, 10, 10)).astype(float)
+    values[0, 3, 3] = np.nan
+    values[2, 4, 4] = -999
+    stats = STATS + ["median", "percentile_90", "std", "majority", "minority", "unique", "nodata"]
+
+    result = sample_grids(values, GEOMETRIES, AFFINE, nodata=-999, stats=stats)
+    expected = np.array(
+        [sample_geoseries(i, GEOMETRIES, AFFINE, nodata=-999, stats=stats) for i in values],
+        dtype=float,
+    )
+
+    assert np.allclose(result, expected, equal_nan=True)
@@ -2,9 +2,10 @@ __version__ = "2025.1.0"
 import warnings
 
 from wiwb.api import Api
+from wiwb.async_api import ThreadedAsyncApi
 from wiwb.auth import Auth
 
-__all__ = ["Auth", "Api"]
+__all__ = ["Auth", "Api", "ThreadedAsyncApi"]
 
 warnings.filterwarnings(
     "ignore",
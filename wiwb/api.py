@@ -1,36 +1,111 @@
-from dataclasses import dataclass
-from typing import Union
+import copy
+import threading
+from dataclasses import dataclass, field
+from typing import Tuple, Union
 
 from wiwb.api_calls.get_data_sources import GetDataSources
 from wiwb.api_calls.get_grids import GetGrids
 from wiwb.api_calls.get_variables import GetVariables
 from wiwb.auth import Auth
-from wiwb.constants import API_URL
+from wiwb.catalogue import Catalogue
+from wiwb.constants import API_URL, BACKOFF_FACTOR, MAX_RETRIES, POOL_SIZE, TIMEOUT
+from wiwb.session import Session
 
 
 @dataclass
 class Api:
-    """Python API for WIWB service."""
+    """Python API for WIWB service.
+
+    Attributes
+    ----------
+    auth : Auth
+        WIWB authorization. If not provided it will be initialized from os environment
+        variables. A provided auth with another session than the Api is copied, so the
+        provided auth itself is not modified
+    base_url : str
+        WIWB API url. By default https://wiwb.hydronet.com/api
+    session : Session
+        Pooled HTTP session, shared by auth and all requests. If not provided it will be
+        initialized with pool_size, keep_alive and timeout
+    pool_size : int
+        Number of connections kept alive per host. By default 10
+    keep_alive : bool
+        Keep connections alive between requests. By default True
+    timeout : Union[float, Tuple[float, float]]
+        Default timeout in seconds, as float or (connect, read) tuple. By default (10, 300)
+    max_retries : int
+        Maximum number of retries of requests failing with a connection error, 429 or 5xx
+        status code. By default 3
+    backoff_factor : float
+        Retry n waits a random time up to backoff_factor * 2**n seconds, unless the server
+        specifies Retry-After. By default 0.5
+    rate_limit : float, optional
+        Maximum sustained number of requests per second. By default None (no limit)
+    catalogue : Catalogue, optional
+        Local catalogue to get data sources and variables from and to validate grid
+        requests against before sending them. By default None (always ask the server).
+        A catalogue not bound to base_url and auth of the Api is copied, not modified
+    """
 
     auth: Union[Auth, None] = None
     base_url: str = API_URL
+    session: Union[Session, None] = field(default=None, repr=False)
+    pool_size: int = POOL_SIZE
+    keep_alive: bool = True
+    timeout: Union[float, Tuple[float, float], None] = TIMEOUT
+    max_retries: int = MAX_RETRIES
+    backoff_factor: float = BACKOFF_FACTOR
+    rate_limit: Union[float, None] = None
+    catalogue: Union[Catalogue, None] = None
 
     def __post_init__(self):
+        if self.session is None:
+            self.session = Session(
+                pool_size=self.pool_size,
+                keep_alive=self.keep_alive,
+                timeout=self.timeout,
+                max_retries=self.max_retries,
+                backoff_factor=self.backoff_factor,
+                rate_limit=self.rate_limit,
+            )
         if self.auth is None:
-            self.auth = Auth()
+            self.auth = Auth(session=self.session)
+        elif self.auth.session is not self.session:
+            # use a copy, keeping its token, so the session of the auth of the caller
+            # (possibly shared with other Apis) is left untouched
+            auth = copy.copy(self.auth)
+            auth.session = self.session
+            auth._lock = threading.Lock()
+            self.auth = auth
         if self.base_url is None:
             raise ValueError(
                 f"Provide a valid base_url. Current value is {self.base_url}"
             )
+        if self.catalogue is not None:
+            self.catalogue = self.catalogue.bind(self.base_url, self.auth)
 
     def get_data_sources(self, **kwargs):
+        if self.catalogue is not None:
+            return self.catalogue.data_sources(
+                kwargs.get("primary_structure_types", ["Grid"])
+            )
         api_call = GetDataSources(base_url=self.base_url, auth=self.auth, **kwargs)
         return api_call.run()
 
     def get_variables(self, **kwargs):
+        if (self.catalogue is not None) and kwargs.get("data_source_codes"):
+            variables = {
+                code: variable
+                for data_source_code in kwargs["data_source_codes"]
+                for code, variable in self.catalogue.variables(data_source_code).items()
+            }
+            variable_codes = kwargs.get("variable_codes")
+            if variable_codes:
+                variables = {k: v for k, v in variables.items() if k in variable_codes}
+            return variables
         api_call = GetVariables(base_url=self.base_url, auth=self.auth, **kwargs)
         return api_call.run()
 
     def get_grids(self, **kwargs):
-        get_grids = GetGrids(base_url=self.base_url, auth=self.auth, **kwargs)
-        return get_grids
+        kwargs.setdefault("catalogue", self.catalogue)
+        return GetGrids(base_url=self.base_url, auth=self.auth, **kwargs)
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
 
+import requests
+
 from wiwb.auth import Auth
 
 
@@ -12,6 +14,11 @@ class Request:
         if self.base_url.endswith("/"):
             self.base_url = self.base_url[:-1]
 
+    @property
+    def session(self) -> requests.Session:
+        """HTTP session, shared with auth"""
+        return self.auth.session
+
     @property
     def url(self) -> str:
         return f"{self.base_url}/{self.url_post_fix}"
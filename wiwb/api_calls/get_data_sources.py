@@ -2,8 +2,7 @@ import logging
 from dataclasses import dataclass, field
 from typing import Dict
 
-import requests
-
+from wiwb import metrics
 from wiwb.api_calls import Request
 from wiwb.constants import PRIMARY_STRUCTURE_TYPES
 
@@ -23,7 +22,9 @@ class GetDataSources(Request):
         return "entity/datasources/get"
 
     def run(self) -> Dict:
-        response = requests.post(self.url, headers=self.auth.headers, json={})
+        with metrics.phase("request.datasources") as phase:
+            response = self.session.post(self.url, headers=self.auth.headers, json={})
+            phase.add(bytes=len(response.content))
 
         if response.ok:  # return list of data sources
             return {
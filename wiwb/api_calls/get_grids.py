@@ -1,49 +1,92 @@
+import io
 import logging
+import shutil
 import tempfile
-from dataclasses import InitVar, dataclass, field
-from datetime import date
+import weakref
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import InitVar, dataclass, field, replace
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple, Union
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 import pyproj
 import requests
 from geopandas import GeoSeries
-from pandas import DataFrame
+from pandas import DataFrame, Timestamp, concat, date_range
 from shapely.geometry import MultiPolygon, Point, Polygon
 
+from wiwb import metrics
 from wiwb.api_calls import Request
 from wiwb.api_calls.body import RequestBody, ReaderSettings, Interval, Extent, Exporter, Reader
+from wiwb.cache import GridCache
+from wiwb.catalogue import Catalogue
 from wiwb.constants import (
     DATA_FORMAT_CODES,
     FILE_SUFFICES,
     INTERVAL_TYPES,
+    SAMPLE_DATA_FORMAT_CODES,
     get_defaults,
 )
 from wiwb.converters import snake_to_pascal_case
-from wiwb.sample import sample_netcdf
+from wiwb.sample import sample_netcdf, sample_zip
 
 logger = logging.getLogger(__name__)
 defaults = get_defaults()
 
 @dataclass
 class GetGrids(Request):
-    """GetGrids request"""
+    """GetGrids request
+
+    Specify a wiwb.cache.GridCache as cache to re-use earlier downloads of the same
+    request. Downloads for a cache are always streamed into the cache directory.
+
+    Specify a wiwb.catalogue.Catalogue as catalogue to validate the data sources and
+    variables on init, so a wrong code fails locally instead of at the server.
+
+    Long periods can be requested in chunks by specifying a time_window, e.g. "MS" for
+    calendar months or "7D" for weeks (any pandas frequency or a timedelta). Chunks are
+    downloaded and sampled concurrently by max_workers threads and merged in time order.
+
+    Multiple variables, of one or more data sources, can be requested at once by
+    specifying variables as {data_source_code: [variable_code, ...]}. These are downloaded
+    in one request and sampled in one pass, with a top-level "variable" column. The
+    data_source_code and variable_code are then only used if not in variables.
+
+    to_directory writes the response as one file, e.g. a zip-archive for geotiff. Specify
+    unzip=True to extract zip-archives into the output directory instead.
+    """
 
     data_source_code: str
     variable_code: str
     start_date: date
     end_date: date
-    unzip: bool = True
+    unzip: bool = False
     interval: Tuple[str, int] = ("Hours", 1)
     data_format_code: DATA_FORMAT_CODES = "geotiff"
     geometries: InitVar[Union[
         GeoSeries, Iterable[Union[Point, Polygon, MultiPolygon]], None
     ]] = None
     bounds: InitVar[Union[Tuple[float, float, float, float], None]] = defaults.bounds
+    stream: bool = False
+    download_chunk_size: int = 1024 * 1024
+    progress_callback: Union[Callable[[int], None], None] = field(
+        default=None, repr=False
+    )
+    time_window: Union[str, timedelta, None] = None
+    max_workers: int = 4
+    cache: Union[GridCache, None] = field(default=None, repr=False)
+    catalogue: Union[Catalogue, None] = field(default=None, repr=False)
+    variables: Union[Dict[str, List[str]], None] = None
 
     _response: Union[requests.Response, None] = field(
         init=False, default=None, repr=False
     )
+    _file: Union[Path, None] = field(init=False, default=None, repr=False)
+    _temp_file: Union[Path, None] = field(init=False, default=None, repr=False)
+    _temp_file_finalizer: Union[weakref.finalize, None] = field(init=False, default=None, repr=False)
+    _chunks: List["GetGrids"] = field(init=False, default_factory=list, repr=False)
+    _chunks_key: Union[Tuple, None] = field(init=False, default=None, repr=False)
     _geoseries: int = field(init=False, default=None)
     _bounds: Union[Tuple[float, float, float, float], None] = field(
         init=False, default=None
@@ -52,6 +95,9 @@ class GetGrids(Request):
     def __post_init__(self, geometries, bounds):
         self.set_geometries(geometries)
         self.set_bounds(bounds)
+        if self.catalogue is not None:
+            self.catalogue = self.catalogue.bind(self.base_url, self.auth)
+            self.catalogue.validate(self.readers)
 
     @property
     def epsg(self):
@@ -62,20 +108,33 @@ class GetGrids(Request):
         return self.body.readers[0].settings.extent.crs
 
     @property
-    def body(self) -> RequestBody:
-        reader_settings = ReaderSettings(
-            start_date=self.start_date,
-            end_date=self.end_date,
-            variable_codes=[self.variable_code],
-            interval=Interval(*self.interval),
-            extent=Extent(*self.bounds),
-        )
+    def readers(self) -> Dict[str, List[str]]:
+        """Variable codes to request per data source code"""
+        if self.variables is None:
+            return {self.data_source_code: [self.variable_code]}
+        return self.variables
 
-        reader = Reader(self.data_source_code, settings=reader_settings)
+    @property
+    def variable_codes(self) -> List[str]:
+        """All variable codes to request"""
+        return [j for i in self.readers.values() for j in i]
+
+    @property
+    def body(self) -> RequestBody:
+        readers = []
+        for data_source_code, variable_codes in self.readers.items():
+            reader_settings = ReaderSettings(
+                start_date=self.start_date,
+                end_date=self.end_date,
+                variable_codes=variable_codes,
+                interval=Interval(*self.interval),
+                extent=Extent(*self.bounds),
+            )
+            readers.append(Reader(data_source_code, settings=reader_settings))
 
         exporter = Exporter(data_format_code=self.data_format_code)
 
-        return RequestBody(readers=[reader], exporter=exporter)
+        return RequestBody(readers=readers, exporter=exporter)
 
     @property
     def bbox(self):  # noqa:F811
@@ -85,10 +144,12 @@ class GetGrids(Request):
     def file_name(self):
         stem = "_".join(
             [
-                self.data_source_code,
-                self.variable_code,
-                self.start_date.isoformat(),
-                self.end_date.isoformat(),
+                *self.readers.keys(),
+                *self.variable_codes,
+                *(
+                    i.strftime("%Y-%m-%dT%H%M%S") if isinstance(i, datetime) else i.isoformat()
+                    for i in (self.start_date, self.end_date)
+                ),
             ]
         )
         suffix = FILE_SUFFICES[self.data_format_code]
@@ -132,7 +193,9 @@ class GetGrids(Request):
             logger.warning(f"no crs specified in geoseries, will be set to {self.epsg}")
             geoseries.crs = self.epsg
         else:
-            geoseries = geoseries.to_crs(self.epsg)
+            with metrics.phase("reproject") as phase:
+                geoseries = geoseries.to_crs(self.epsg)
+                phase.add(geometries=len(geoseries))
         return geoseries
 
     def _get_bounds(self, bounds: Union[Tuple[float, float, float, float], None]):
@@ -150,11 +213,175 @@ class GetGrids(Request):
             )
         return bounds
 
+    @property
+    def is_downloaded(self) -> bool:
+        if self.time_window is not None:
+            return (self._chunks_key == self._chunk_key()) and all(
+                i.is_downloaded for i in self._chunks
+            )
+        return (self._response is not None) or (self._file is not None)
+
+    @property
+    def interval_step(self) -> timedelta:
+        """Time between timesteps of interval, or 1 second for interval type None"""
+        interval_type, value = self.interval
+        if interval_type == "None":
+            return timedelta(seconds=1)
+        return timedelta(**{interval_type.lower(): value})
+
+    def _time_windows(self) -> List[Tuple[Union[date, datetime], Union[date, datetime]]]:
+        """Split start_date - end_date in consecutive (start, end) windows of time_window.
+        Ends are one interval step before the next start, so no timestep is requested twice.
+        """
+        start, end = Timestamp(self.start_date), Timestamp(self.end_date)
+        starts = list(date_range(start, end, freq=self.time_window))
+        if (not starts) or (starts[0] > start):
+            starts.insert(0, start)
+        if starts[-1] >= end:
+            starts = starts[:-1] or [start]
+        ends = [i - self.interval_step for i in starts[1:]] + [end]
+
+        # keep dates as dates, so file_names stay the same
+        def to_date(timestamp: Timestamp) -> Union[date, datetime]:
+            if timestamp == timestamp.normalize():
+                return timestamp.date()
+            return timestamp.to_pydatetime()
+
+        return [(to_date(i), to_date(j)) for i, j in zip(starts, ends)]
+
+    def _chunk_key(self) -> Tuple:
+        """State chunks are created from, to re-create them if it changes"""
+        return (
+            self.start_date,
+            self.end_date,
+            self.time_window,
+            tuple(self.interval),
+            self.data_format_code,
+            tuple((i, tuple(j)) for i, j in self.readers.items()),
+            self._bounds,
+            id(self._geoseries),
+        )
+
+    def chunks(self) -> List["GetGrids"]:
+        """GetGrids requests for every time_window between start_date and end_date"""
+        if self.time_window is None:
+            return [self]
+        return [
+            replace(
+                self,
+                start_date=start_date,
+                end_date=end_date,
+                time_window=None,
+                geometries=self._geoseries,
+                bounds=self._bounds,
+            )
+            for start_date, end_date in self._time_windows()
+        ]
+
+    def _map_chunks(self, func: Callable) -> list:
+        """Apply func concurrently on all chunks, results are in time order"""
+        if self._chunks_key != self._chunk_key():
+            self._chunks = self.chunks()
+            self._chunks_key = self._chunk_key()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(func, self._chunks))
+
+    def _download(self, file_path: Path) -> None:
+        """Stream response to file_path in chunks, so content is never fully held in memory"""
+        headers = self.auth.headers
+        with metrics.phase("grids.response"):  # until response headers are received
+            response = self.session.post(
+                self.url, headers=headers, json=self.body.json(), stream=True
+            )
+        with response:
+            if not response.ok:
+                response.raise_for_status()
+
+            bytes_received = 0
+            with metrics.phase("grids.transfer") as phase, open(file_path, "wb") as dst:
+                for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+                    dst.write(chunk)
+                    bytes_received += len(chunk)
+                    logger.debug(f"{self.file_name}: {bytes_received} bytes received")
+                    if self.progress_callback is not None:
+                        self.progress_callback(bytes_received)
+                phase.add(bytes=bytes_received)
+
+        self._file = file_path
+
+    def _set_temp_file(self, file_path: Path) -> None:
+        """Own a temporary file, deleted on close, a re-run or garbage collection"""
+        self._temp_file = file_path
+        self._temp_file_finalizer = weakref.finalize(self, file_path.unlink, missing_ok=True)
+
+    def _remove_temp_file(self) -> None:
+        """Delete the temporary file of a streamed download or link to a cached download"""
+        if self._temp_file is not None:
+            self._temp_file_finalizer()
+            if self._file == self._temp_file:
+                self._file = None
+            self._temp_file = None
+            self._temp_file_finalizer = None
+
+    def close(self) -> None:
+        """Delete temporary files of streamed downloads and links to cached downloads. These
+        are also deleted on a re-run and when the request is garbage-collected. Cache files
+        and output files are kept.
+        """
+        for chunk in self._chunks:
+            chunk.close()
+        self._remove_temp_file()
+
+    def __enter__(self) -> "GetGrids":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def run(self):
+        self._remove_temp_file()
         self._response = None
-        self._response = requests.post(
-            self.url, headers=self.auth.headers, json=self.body.json()
-        )
+        self._file = None
+
+        if self.time_window is not None:
+            self._chunks_key = None
+            self._map_chunks(lambda i: i.run())
+            return
+
+        if self.cache is not None:
+            suffix = FILE_SUFFICES[self.data_format_code]
+            key = self.cache.key(self.url, self.body.json())
+            self._file = self.cache.get(key, suffix)
+            if self._file is None:
+                tmp_file_path = self.cache.temp_path(key, suffix)
+                try:
+                    self._download(tmp_file_path)
+                except Exception:
+                    tmp_file_path.unlink(missing_ok=True)
+                    raise
+                self._file = self.cache.put(key, suffix, tmp_file_path)
+            # a link to the cached file, so it stays valid if evicted
+            self._set_temp_file(self._file)
+            return
+
+        if self.stream:
+            with tempfile.NamedTemporaryFile(
+                suffix=f".{FILE_SUFFICES[self.data_format_code]}", delete=False
+            ) as tmp_file:
+                self._set_temp_file(Path(tmp_file.name))
+            try:
+                self._download(self._temp_file)
+            except Exception:
+                self._remove_temp_file()
+                raise
+            return
+
+        headers = self.auth.headers
+        with metrics.phase("grids.request") as phase:  # response headers and content
+            self._response = self.session.post(
+                self.url, headers=headers, json=self.body.json()
+            )
+            phase.add(bytes=len(self._response.content))
 
         if not self._response.ok:
             self._response.raise_for_status()
@@ -190,15 +417,9 @@ class GetGrids(Request):
         bounds = self._get_bounds(bounds)
         self._bounds = bounds
 
-    def write_tempfile(self):
-        with tempfile.NamedTemporaryFile(
-            suffix=FILE_SUFFICES[self.data_format_code], delete=False
-        ) as tmp_file:
-            tmp_file_path = Path(tmp_file.name)
-            tmp_file.write(self._response.content)
-        return tmp_file_path
-
-    def sample(self, stats: Union[str, List[str]] = "mean") -> DataFrame:
+    def sample(
+        self, stats: Union[str, List[str]] = "mean", memory_budget: Optional[int] = None
+    ) -> DataFrame:
         """Sample statistics per geometry
 
         Parameters
@@ -212,10 +433,16 @@ class GetGrids(Request):
                 - max: maximum value of all cells in polygon
                 - min: minimum value of all cells in polygon
                 - percentile_#: percentile value of all cells in polygon. E.g. percentile_50, gives 50th percentile (median) value
-
-            Notes:
-            - Providing multiple values, will create a multi-index column in your dataframe
-            - Providing multiple statistics, as specified above, doesn't make much sense as it will always return the same value
+        memory_budget : Optional[int]
+            Maximum bytes of decoded grids in memory (per chunk). Larger NetCDF grids are sampled
+            in blocks of timesteps. By default None (no maximum)
+
+        Notes
+        -----
+        - Providing multiple values, will create a multi-index column in your dataframe
+        - Providing multiple statistics, as specified above, doesn't make much sense as it will always return the same value
+        - Responses in data_format_code geotiff, netcdf4.cf1p6 and netcdf4.cf1p6.zip are sampled directly. For other
+          formats data_format_code is set to netcdf4.cf1p6 and grids are requested again
         """  # noqa:E501
 
         # check if geometries are set
@@ -224,35 +451,85 @@ class GetGrids(Request):
                 """'geometries' is None, should be list or GeoSeries. Set it first"""
             )
 
-        # check if data_format_code is netcdf
-        if self.data_format_code != "netcdf4.cf1p6":
+        # check if we can sample data_format_code
+        if self.data_format_code not in SAMPLE_DATA_FORMAT_CODES:
             self.data_format_code = "netcdf4.cf1p6"
             self.run()
 
+        # sample chunks concurrently, merge in time order
+        if self.time_window is not None:
+            dfs = self._map_chunks(lambda i: i.sample(stats=stats, memory_budget=memory_budget))
+            return concat([i for i in dfs if not i.empty]).sort_index()
+
         # re-run
-        if self._response is None:
+        if not self.is_downloaded:
             self.run()
 
-        # write content in temp-file
-        temp_file = self.write_tempfile()
-
-        # sample temp_file
-        df = sample_netcdf(
-            nc_file=temp_file,
-            variable_code=self.variable_code,
-            geometries=self.geoseries,
-            stats=stats,
-            unlink=True,
-        )
+        # sample the downloaded file, or the response content in memory
+        if self._file is not None:
+            source = self._file
+        else:
+            source = self._response.content
+
+        # one variable as before, more variables sampled at once
+        variable_code = self.variable_code if self.variables is None else self.variable_codes
+
+        if FILE_SUFFICES[self.data_format_code] == "zip":
+            df = sample_zip(
+                zip_file=source,
+                variable_code=variable_code,
+                geometries=self.geoseries,
+                stats=stats,
+                memory_budget=memory_budget,
+            )
+        else:
+            df = sample_netcdf(
+                nc_file=source,
+                variable_code=variable_code,
+                geometries=self.geoseries,
+                stats=stats,
+                memory_budget=memory_budget,
+            )
 
         return df
 
     def to_directory(self, output_dir: Union[str, Path]):
-        """Write response.content to an output-file"""
-        if self._response is None:
-            self.run()
+        """Write response.content to an output-file.
 
+        If stream is True, a download is streamed directly into the output-file. If unzip is
+        True, zip-archives are extracted into output_dir.
+        """
         output_dir = Path(output_dir)
         output_dir.mkdir(parents=True, exist_ok=True)
+
+        # write one file per chunk
+        if self.time_window is not None:
+            self._map_chunks(lambda i: i.to_directory(output_dir))
+            return
+
         output_file = output_dir / self.file_name
-        output_file.write_bytes(self._response.content)
+        unzip = self.unzip and (FILE_SUFFICES[self.data_format_code] == "zip")
+
+        if self.stream and (self.cache is None) and not (unzip or self.is_downloaded):
+            self._download(output_file)
+            return
+
+        if not self.is_downloaded:
+            self.run()
+
+        with metrics.phase("grids.write") as phase:
+            if unzip:
+                if self._file is not None:
+                    source = self._file
+                else:
+                    source = io.BytesIO(self._response.content)
+                with zipfile.ZipFile(source) as archive:
+                    archive.extractall(output_dir)
+                    phase.add(bytes=sum(i.file_size for i in archive.infolist()))
+            elif self._file is not None:
+                if self._file != output_file:
+                    shutil.copyfile(self._file, output_file)
+                    phase.add(bytes=output_file.stat().st_size)
+            else:
+                output_file.write_bytes(self._response.content)
+                phase.add(bytes=len(self._response.content))
@@ -2,8 +2,7 @@ import logging
 from dataclasses import dataclass, field
 from typing import List
 
-import requests
-
+from wiwb import metrics
 from wiwb.api_calls import Request
 
 logger = logging.getLogger(__name__)
@@ -28,7 +27,9 @@ class GetVariables(Request):
         }
 
     def run(self) -> List[str]:
-        response = requests.post(self.url, headers=self.auth.headers, json=self.json)
+        with metrics.phase("request.variables") as phase:
+            response = self.session.post(self.url, headers=self.auth.headers, json=self.json)
+            phase.add(bytes=len(response.content))
 
         if response.ok:  # return list of data sources
             return response.json()["Variables"]
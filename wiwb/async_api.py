@@ -0,0 +1,102 @@
+"""asyncio interface to the WIWB Api, backed by a thread pool"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from pandas import DataFrame
+
+from wiwb.api import Api
+from wiwb.api_calls.get_grids import GetGrids
+
+
+@dataclass
+class ThreadedAsyncApi(Api):
+    """asyncio interface to Api for issuing many requests concurrently from async code.
+
+    This is a convenience over a thread pool, not non-blocking I/O: every request runs the
+    blocking client in one of max_concurrency threads, so at most max_concurrency requests
+    are in flight at once and each holds a thread. Requests share the pooled session of
+    the Api. Use it as async context manager, or await aclose(), to shut down the threads
+    and close the session.
+
+    Attributes
+    ----------
+    max_concurrency : int
+        Maximum number of concurrent requests, the number of threads. The session
+        pool_size is raised to at least this number. By default 10
+
+    Examples
+    --------
+    import asyncio
+    from wiwb import ThreadedAsyncApi
+
+    >>> async def main():
+    ...     async with ThreadedAsyncApi(max_concurrency=20) as api:
+    ...         grids = [api.get_grids(**kwargs) for kwargs in requests]
+    ...         return await asyncio.gather(*(i.sample() for i in grids))
+    >>> dfs = asyncio.run(main())
+    """
+
+    max_concurrency: int = 10
+    _executor: ThreadPoolExecutor = field(init=False, default=None, repr=False)
+
+    def __post_init__(self):
+        self.pool_size = max(self.pool_size, self.max_concurrency)
+        super().__post_init__()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="wiwb")
+
+    async def run_in_executor(self, func: Callable, *args, **kwargs):
+        """Run a blocking function in a thread of this api"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def get_data_sources(self, **kwargs) -> Dict:
+        return await self.run_in_executor(super().get_data_sources, **kwargs)
+
+    async def get_variables(self, **kwargs) -> Dict:
+        return await self.run_in_executor(super().get_variables, **kwargs)
+
+    def get_grids(self, **kwargs) -> "ThreadedAsyncGetGrids":
+        return ThreadedAsyncGetGrids(grids=super().get_grids(**kwargs), api=self)
+
+    def close(self) -> None:
+        """Shut down the threads, after running requests finished, and close the session"""
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    async def aclose(self) -> None:
+        """Shut down the threads and close the session, without blocking the event loop"""
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self) -> "ThreadedAsyncApi":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+
+@dataclass
+class ThreadedAsyncGetGrids:
+    """GetGrids request with awaitable run, sample, to_directory and aclose, run in the
+    threads of a ThreadedAsyncApi. The GetGrids request itself is grids.
+    """
+
+    grids: GetGrids
+    api: ThreadedAsyncApi = field(repr=False)
+
+    async def run(self) -> None:
+        await self.api.run_in_executor(self.grids.run)
+
+    async def sample(self, stats: Union[str, List[str]] = "mean", memory_budget: Optional[int] = None) -> DataFrame:
+        return await self.api.run_in_executor(self.grids.sample, stats=stats, memory_budget=memory_budget)
+
+    async def to_directory(self, output_dir: Union[str, Path]) -> None:
+        await self.api.run_in_executor(self.grids.to_directory, output_dir)
+
+    async def aclose(self) -> None:
+        """Delete temporary files of streamed downloads"""
+        await self.api.run_in_executor(self.grids.close)
@@ -1,17 +1,21 @@
 """Authorization for the WIWB API"""
 
+import threading
+import time
 from dataclasses import dataclass, field
 from typing import Union
 
 import jwt
 import requests
 
+from wiwb import metrics
 from wiwb.constants import AUTH_URL, CLIENT_ID, CLIENT_SECRET
+from wiwb.session import Session
 
 try:
-    from datetime import datetime, timedelta, UTC
+    from datetime import UTC, datetime
 except ImportError: # support Python 3.9
-    from datetime import datetime, timezone, timedelta
+    from datetime import datetime, timezone
     UTC = timezone.utc
 
 
@@ -31,8 +35,20 @@ class Auth:
          variable `wiwb_client_secret`. By default {CLIENT_SECRET}.
     url: str
         A valid WIWB token url. By default {AUTH_URL}.
+    session: requests.Session
+        HTTP session used for token requests and shared by all requests using this
+        authorization. By default a new wiwb.session.Session.
+    refresh_margin: float
+        Seconds before expiry at which a token is refreshed. By default 60.
     token: str
         A valid WIWB access token
+    refresh_count: int
+        Number of tokens requested since init
+
+    Notes
+    -----
+    Auth is thread-safe. If the token is about to expire, one thread refreshes it while
+    other threads wait for, and use, that same fresh token.
 
     Examples
     --------
@@ -48,9 +64,18 @@ class Auth:
     client_id: str = CLIENT_ID
     client_secret: str = CLIENT_SECRET
     url: str = AUTH_URL
+    session: Union[requests.Session, None] = field(default=None, repr=False)
     _token: Union[str, None] = field(default=None, repr=False)
+    refresh_margin: float = 60
+    refresh_count: int = field(init=False, default=0)
+    _token_expiry: float = field(init=False, default=0.0, repr=False)
+    _lock: threading.Lock = field(
+        init=False, default_factory=threading.Lock, repr=False
+    )
 
     def __post_init__(self):
+        if self.session is None:
+            self.session = Session()
 
         # check if client_id and client_secret are valid
         if self.client_id is None:
@@ -72,18 +97,21 @@ class Auth:
     def token(self) -> str:
         """Return a valid WIWB access token."""
         if not self.is_token_valid:
-            self._get_token()
+            with self._lock:
+                # another thread may have refreshed the token while we waited
+                if not self.is_token_valid:
+                    self._get_token()
         return self._token
 
+    @property
+    def token_expiry(self) -> datetime:
+        """UTC datetime at which the current token expires."""
+        return datetime.fromtimestamp(self._token_expiry, UTC)
+
     @property
     def is_token_valid(self) -> bool:
-        """Check if current token is still valid."""
-        token_decoded = jwt.decode(self._token, options={"verify_signature": False})
-        token_exp_datetime = datetime.fromtimestamp(token_decoded["exp"], UTC)
-        # token_exp_datetime = datetime.utcfromtimestamp(token_decoded["exp"])
-        current_datetime = datetime.now(UTC) - timedelta(minutes=1)
-        # current_datetime = datetime.utcnow() - timedelta(minutes=1)
-        return current_datetime < token_exp_datetime
+        """Check if current token is still valid for at least refresh_margin seconds."""
+        return time.time() < self._token_expiry - self.refresh_margin
 
     @property
     def headers(self) -> dict:
@@ -95,16 +123,22 @@ class Auth:
 
     def _get_token(self) -> None:
         """Get, and store, a fresh WIWB access token"""
-        response = requests.post(
-            self.url,
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            data={
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-                "grant_type": "client_credentials",
-            },
-        )
+        with metrics.phase("auth.token") as phase:
+            response = self.session.post(
+                self.url,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                data={
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                    "grant_type": "client_credentials",
+                },
+            )
+            phase.add(bytes=len(response.content))
         if response.ok:
-            self._token = response.json()["access_token"]
+            token = response.json()["access_token"]
+            token_decoded = jwt.decode(token, options={"verify_signature": False})
+            self._token = token
+            self._token_expiry = float(token_decoded["exp"])
+            self.refresh_count += 1
         else:
             response.raise_for_status()
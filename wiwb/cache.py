@@ -0,0 +1,191 @@
+"""Content-addressed on-disk cache for WIWB grid downloads"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Union
+
+from wiwb.constants import CACHE_DIR, CACHE_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GridCache:
+    """Content-addressed on-disk cache for grid downloads.
+
+    Downloads are stored under the data source codes and a hash of the request url and
+    body. The least recently used files are evicted if the cache exceeds max_size. File
+    modification times record when a download was cached, access times when it was last
+    used.
+
+    get and put return a hard link (or copy) of the cached file, owned by the caller, so
+    it stays valid if the cached file is evicted. The caller deletes it when done, GetGrids
+    does so on close, a re-run or garbage collection.
+
+    Attributes
+    ----------
+    directory : Union[Path, str]
+        Cache directory. If not provided it will be read from the os environment
+        variable `wiwb_cache_dir`. By default ~/.cache/wiwb
+    max_size : int
+        Maximum size of the cache in bytes. By default 10 * 1024**3 (10 GiB)
+    ttl : float, optional
+        Time to live in seconds. Downloads cached longer ago are considered stale and
+        will be downloaded again. By default None (never stale)
+    ttls : Dict[str, float], optional
+        Time to live in seconds per data source code, overriding ttl, e.g. a short ttl for
+        a radar nowcast and None for a fixed reanalysis. A download of multiple data
+        sources is stale after the shortest of their ttls. By default {}
+
+    Examples
+    --------
+    from wiwb import Api
+    from wiwb.cache import GridCache
+
+    >>> api = Api()
+    >>> grids = api.get_grids(..., cache=GridCache())
+    >>> grids.sample() # downloads and caches grids
+    >>> grids.sample() # samples cached grids
+    >>> grids.cache.stats
+    {'hits': 1, 'misses': 1, 'files': 1, 'size': 8380}
+    """
+
+    directory: Union[Path, str] = CACHE_DIR
+    max_size: int = CACHE_MAX_SIZE
+    ttl: Union[float, None] = None
+    ttls: Dict[str, Union[float, None]] = field(default_factory=dict)
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        self.directory = Path(self.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(url: str, body: Dict) -> str:
+        """Cache key for a request: data source codes and hash of url and json-body"""
+        content = json.dumps({"url": url, "body": body}, sort_keys=True, default=str)
+        key = hashlib.sha256(content.encode()).hexdigest()
+        data_source_codes = sorted({i["DataSourceCode"] for i in body.get("Readers", [])})
+        if data_source_codes:
+            return f"{'+'.join(data_source_codes)}.{key}"
+        return key
+
+    def path(self, key: str, suffix: str) -> Path:
+        return self.directory / f"{key}.{suffix}"
+
+    def files(self) -> list:
+        return [i for i in self.directory.iterdir() if i.is_file() and not i.name.startswith(".")]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Cache hits and misses since init and current number of files and size in bytes"""
+        files = self.files()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "files": len(files),
+            "size": sum(i.stat().st_size for i in files),
+        }
+
+    @staticmethod
+    def data_source_codes(file_path: Path) -> List[str]:
+        """Return the data source codes of a cached file, from its key."""
+        parts = file_path.name.rsplit(".", 2)
+        return parts[0].split("+") if len(parts) == 3 else []
+
+    def file_ttl(self, file_path: Path) -> Union[float, None]:
+        """Return the time to live of a cached file: the shortest ttl of its data sources."""
+        ttls = [self.ttls.get(i, self.ttl) for i in self.data_source_codes(file_path)]
+        ttls = [i for i in (ttls or [self.ttl]) if i is not None]
+        return min(ttls) if ttls else None
+
+    def is_stale(self, file_path: Path) -> bool:
+        ttl = self.file_ttl(file_path)
+        if ttl is None:
+            return False
+        return (time.time() - file_path.stat().st_mtime) > ttl
+
+    def _link(self, file_path: Path) -> Path:
+        """Hard link (or copy, if not supported) to a cached file, owned by the caller"""
+        link_path = self.directory / f".{uuid.uuid4().hex}.{file_path.name}"
+        try:
+            os.link(file_path, link_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(file_path, link_path)
+        return link_path
+
+    def get(self, key: str, suffix: str) -> Union[Path, None]:
+        """Return a link to a cached download, or None if not (or stale) in cache.
+
+        The link is owned by the caller and not evicted, delete it when done.
+        """
+        file_path = self.path(key, suffix)
+        with self._lock:
+            try:
+                if not self.is_stale(file_path):
+                    link_path = self._link(file_path)
+                    self.hits += 1
+                    os.utime(file_path, (time.time(), file_path.stat().st_mtime))
+                    logger.debug(f"cache hit: {file_path}")
+                    return link_path
+            except FileNotFoundError:  # not cached, or evicted by another process
+                pass
+            self.misses += 1
+        logger.debug(f"cache miss: {file_path}")
+        return None
+
+    def temp_path(self, key: str, suffix: str) -> Path:
+        """Path in the cache directory to download to, before calling put"""
+        return self.directory / f".{key}.{threading.get_ident()}.{suffix}"
+
+    def put(self, key: str, suffix: str, file_path: Path) -> Path:
+        """Move a downloaded file into the cache and evict least recently used files.
+
+        Returns a link to the cached file, owned by the caller like the link of get.
+        """
+        cache_path = self.path(key, suffix)
+        with self._lock:
+            os.replace(file_path, cache_path)
+            link_path = self._link(cache_path)
+        self.evict(keep=cache_path)
+        return link_path
+
+    def evict(self, keep: Union[Path, None] = None) -> None:
+        """Remove least recently used and stale files until size <= max_size."""
+        with self._lock:
+            files = []
+            for file_path in self.files():
+                try:
+                    stat = file_path.stat()
+                except FileNotFoundError:
+                    continue
+                if self.is_stale(file_path) and file_path != keep:
+                    file_path.unlink(missing_ok=True)
+                else:
+                    files.append((stat.st_atime, stat.st_size, file_path))
+
+            size = sum(i[1] for i in files)
+            for _, file_size, file_path in sorted(files):
+                if size <= self.max_size:
+                    break
+                if file_path == keep:
+                    continue
+                file_path.unlink(missing_ok=True)
+                size -= file_size
+                logger.debug(f"evicted from cache: {file_path}")
+
+    def clear(self) -> None:
+        for file_path in self.files():
+            file_path.unlink(missing_ok=True)
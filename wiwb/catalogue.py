@@ -0,0 +1,267 @@
+"""Persistent local catalogue of WIWB data sources and variables"""
+
+import difflib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Union, get_args
+
+from wiwb.api_calls.get_data_sources import GetDataSources
+from wiwb.api_calls.get_variables import GetVariables
+from wiwb.auth import Auth
+from wiwb.constants import CATALOGUE_FILE, CATALOGUE_TTL, PRIMARY_STRUCTURE_TYPES
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+
+    def _lock_file(file) -> None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(file) -> None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(file) -> None:
+        file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK gives up after 10 seconds
+                pass
+
+    def _unlock_file(file) -> None:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Exclusive lock, across processes, on a lock file next to path."""
+    with open(path.with_name(f".{path.name}.lock"), "a+") as file:
+        _lock_file(file)
+        try:
+            yield
+        finally:
+            _unlock_file(file)
+
+
+def _newest(entry: Union[Dict, None], other: Union[Dict, None]) -> Union[Dict, None]:
+    if entry is None:
+        return other
+    if other is None:
+        return entry
+    return other if other["fetched"] > entry["fetched"] else entry
+
+
+def _suggest(code: str, codes: List[str]) -> str:
+    matches = difflib.get_close_matches(code, codes)
+    return f" Did you mean {matches}?" if matches else ""
+
+
+@dataclass
+class Catalogue:
+    """Persistent local catalogue of data sources and variables, to validate requests
+    without a server round trip.
+
+    Data sources are fetched once per ttl, variables once per ttl per data source on first
+    use. Both are stored as json, per base_url, so they are shared by all processes using
+    the same file: on save the file is read again and the newest entries are kept, under a
+    file lock. Call refresh to fetch again before the ttl expires.
+
+    Attributes
+    ----------
+    path : Union[Path, str]
+        Catalogue file. If not provided it will be read from the os environment variable
+        `wiwb_catalogue_file`. By default ~/.cache/wiwb_catalogue.json
+    ttl : float, optional
+        Time to live in seconds. By default 604800 (a week). None is never stale
+    base_url : str
+        WIWB API url to fetch from. Bound by Api and GetGrids
+    auth : Auth
+        WIWB authorization to fetch with. Bound by Api and GetGrids
+
+    Examples
+    --------
+    from wiwb import Api
+    from wiwb.catalogue import Catalogue
+
+    >>> api = Api(catalogue=Catalogue())
+    >>> api.catalogue.data_source_codes("Grid")
+    ['Meteobase.Precipitation', ...]
+    >>> api.get_grids(data_source_code="Meteobase.Precipitation", variable_code="Q", ...)
+    ValueError: variable_code Q not in data source Meteobase.Precipitation. Did you mean ['P']?
+    """
+
+    path: Union[Path, str] = CATALOGUE_FILE
+    ttl: Union[float, None] = CATALOGUE_TTL
+    base_url: Union[str, None] = None
+    auth: Union[Auth, None] = field(default=None, repr=False)
+    _catalogues: Union[Dict[str, Dict], None] = field(init=False, default=None, repr=False)
+    _by_type: Dict[str, Dict[str, List[str]]] = field(init=False, default_factory=dict, repr=False)
+    _lock: threading.RLock = field(init=False, default_factory=threading.RLock, repr=False)
+
+    def __post_init__(self):
+        self.path = Path(self.path)
+
+    @property
+    def _catalogue(self) -> Dict:
+        """Catalogue of base_url, loaded from path on first use"""
+        if self._catalogues is None:
+            self._catalogues = self._read()
+        return self._catalogues.setdefault(self.base_url, {"data_sources": None, "variables": {}})
+
+    def is_stale(self, entry: Union[Dict, None]) -> bool:
+        if entry is None:
+            return True
+        if self.ttl is None:
+            return False
+        return (time.time() - entry["fetched"]) > self.ttl
+
+    def _fetch(self, request) -> Dict:
+        return {"fetched": time.time(), "items": request.run()}
+
+    def bind(self, base_url: str, auth: Auth) -> "Catalogue":
+        """Return this catalogue if bound to base_url and auth, else a bound copy."""
+        if (self.base_url == base_url) and (self.auth is auth):
+            return self
+        return replace(self, base_url=base_url, auth=auth)
+
+    def _read(self) -> Dict[str, Dict]:
+        if self.path.exists():
+            try:
+                return json.loads(self.path.read_text())
+            except ValueError:
+                logger.warning(f"ignoring invalid catalogue {self.path}")
+        return {}
+
+    def _merge(self, catalogues: Dict[str, Dict]) -> None:
+        """Merge catalogues read from path, keeping the newest entries."""
+        for base_url, other in catalogues.items():
+            catalogue = self._catalogues.setdefault(base_url, {"data_sources": None, "variables": {}})
+            data_sources = _newest(catalogue["data_sources"], other["data_sources"])
+            if data_sources is not catalogue["data_sources"]:
+                catalogue["data_sources"] = data_sources
+                self._by_type.pop(base_url, None)
+            for code, entry in other["variables"].items():
+                catalogue["variables"][code] = _newest(catalogue["variables"].get(code), entry)
+            # drop variables fetched before a refresh in this or another process
+            refreshed = max(catalogue.get("refreshed", 0), other.get("refreshed", 0))
+            if refreshed:
+                catalogue["refreshed"] = refreshed
+                catalogue["variables"] = {
+                    code: entry for code, entry in catalogue["variables"].items() if entry["fetched"] >= refreshed
+                }
+
+    def save(self) -> None:
+        """Write the catalogue to path, merged with entries saved by other processes."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, _file_lock(self.path):
+            self._merge(self._read())
+            temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            temp_path.write_text(json.dumps(self._catalogues, indent=1))
+            os.replace(temp_path, self.path)
+
+    def _data_sources(self) -> Dict[str, Dict]:
+        if (self.base_url is None) or (self.auth is None):
+            raise ValueError("Catalogue has no base_url and auth. Use it with Api(catalogue=...)")
+        with self._lock:
+            catalogue = self._catalogue
+            if self.is_stale(catalogue["data_sources"]):
+                catalogue["data_sources"] = self._fetch(
+                    GetDataSources(
+                        auth=self.auth,
+                        base_url=self.base_url,
+                        primary_structure_types=list(get_args(PRIMARY_STRUCTURE_TYPES)),
+                    )
+                )
+                self._by_type.pop(self.base_url, None)
+                self.save()
+            return catalogue["data_sources"]["items"]
+
+    def data_sources(
+        self, primary_structure_types: Union[List[PRIMARY_STRUCTURE_TYPES], None] = None
+    ) -> Dict[str, Dict]:
+        """Get data sources by code, optionally only of primary_structure_types."""
+        data_sources = self._data_sources()
+        if primary_structure_types is None:
+            return dict(data_sources)
+        return {
+            code: data_sources[code]
+            for primary_structure_type in primary_structure_types
+            for code in self.data_source_codes(primary_structure_type)
+        }
+
+    def data_source_codes(self, primary_structure_type: PRIMARY_STRUCTURE_TYPES) -> List[str]:
+        """Codes of data sources with a PrimaryStructureType"""
+        data_sources = self._data_sources()
+        with self._lock:
+            if self.base_url not in self._by_type:
+                by_type = {}
+                for code, data_source in data_sources.items():
+                    by_type.setdefault(data_source.get("PrimaryStructureType"), []).append(code)
+                self._by_type[self.base_url] = by_type
+            return list(self._by_type[self.base_url].get(primary_structure_type, []))
+
+    def _variables(self, data_source_code: str) -> Dict[str, Dict]:
+        data_sources = self._data_sources()
+        if data_source_code not in data_sources:
+            raise ValueError(
+                f"data_source_code {data_source_code} not in catalogue."
+                f"{_suggest(data_source_code, list(data_sources))}"
+            )
+        with self._lock:
+            catalogue = self._catalogue
+            entry = catalogue["variables"].get(data_source_code)
+            if self.is_stale(entry):
+                entry = self._fetch(
+                    GetVariables(
+                        auth=self.auth,
+                        base_url=self.base_url,
+                        data_source_codes=[data_source_code],
+                    )
+                )
+                entry["items"] = {
+                    code: variable
+                    for code, variable in entry["items"].items()
+                    if variable.get("DataSourceCode", data_source_code) == data_source_code
+                }
+                catalogue["variables"][data_source_code] = entry
+                self.save()
+            return entry["items"]
+
+    def variables(self, data_source_code: str) -> Dict[str, Dict]:
+        """Variables of a data source by code"""
+        return dict(self._variables(data_source_code))
+
+    def validate(self, readers: Dict[str, List[str]]) -> None:
+        """Raise a ValueError if a data source or variable is not in the catalogue.
+
+        Data sources and variables are specified as {data_source_code: [variable_code, ...]}.
+        """
+        for data_source_code, variable_codes in readers.items():
+            variables = self._variables(data_source_code)
+            for variable_code in variable_codes:
+                if variable_code not in variables:
+                    raise ValueError(
+                        f"variable_code {variable_code} not in data source {data_source_code}."
+                        f"{_suggest(variable_code, list(variables))}"
+                    )
+
+    def refresh(self) -> None:
+        """Fetch data sources again. Variables are fetched again on first use"""
+        with self._lock:
+            catalogue = self._catalogue
+            catalogue["data_sources"] = None
+            catalogue["variables"] = {}
+            catalogue["refreshed"] = time.time()
+            self._data_sources()
@@ -1,5 +1,6 @@
 # %%
 import os
+from pathlib import Path
 from typing import Literal
 
 from geopandas import GeoSeries
@@ -11,6 +12,21 @@ AUTH_URL = (
     "https://login.hydronet.com/auth/realms/hydronet/protocol/openid-connect/token"
 )
 
+POOL_SIZE = 10
+TIMEOUT = (10, 300)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+BACKOFF_MAX = 60
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+CACHE_DIR = Path(os.getenv("wiwb_cache_dir", Path.home() / ".cache" / "wiwb"))
+CACHE_MAX_SIZE = 10 * 1024**3
+
+CATALOGUE_FILE = Path(
+    os.getenv("wiwb_catalogue_file", Path.home() / ".cache" / "wiwb_catalogue.json")
+)
+CATALOGUE_TTL = 7 * 24 * 3600
+
 CLIENT_ID = os.getenv("wiwb_client_id")
 CLIENT_SECRET = os.getenv("wiwb_client_secret")
 
@@ -24,6 +40,8 @@ FILE_SUFFICES = {
     "netcdf4.cf1p6.zip": "zip",
 }
 
+SAMPLE_DATA_FORMAT_CODES = ["geotiff", "netcdf4.cf1p6", "netcdf4.cf1p6.zip"]
+
 PRIMARY_STRUCTURE_TYPES = Literal[
     "EnsembleGrid",
     "EnsembleTimeSeries",
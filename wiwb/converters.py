@@ -1,7 +1,42 @@
 """For converting one thing into another"""
 
+import re
+from datetime import datetime
+from typing import List, Union
+
 
 def snake_to_pascal_case(snake_case: str) -> str:
     """Convert snake_case to PascalCase."""
     words = snake_case.split("_")
     return "".join(i.title() for i in words)
+
+
+# timestamp formats in file names, most specific first
+TIMESTAMP_PATTERNS = [
+    (r"\d{4}-\d{2}-\d{2}T\d{6}", "%Y-%m-%dT%H%M%S"),
+    (r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}", "%Y-%m-%dT%H:%M:%S"),
+    (r"\d{8}T\d{6}", "%Y%m%dT%H%M%S"),
+    (r"\d{14}", "%Y%m%d%H%M%S"),
+    (r"\d{12}", "%Y%m%d%H%M"),
+    (r"\d{4}-\d{2}-\d{2}", "%Y-%m-%d"),
+    (r"\d{8}", "%Y%m%d"),
+]
+
+
+def name_to_timestamps(name: str) -> List[datetime]:
+    """Parse all timestamps in a (file) name, in order of appearance."""
+    found = []
+    for pattern, date_format in TIMESTAMP_PATTERNS:
+        for match in re.finditer(rf"(?<!\d){pattern}(?!\d)", name):
+            if any((match.start() < end) and (start < match.end()) for start, end, _ in found):
+                continue
+            try:
+                found.append((match.start(), match.end(), datetime.strptime(match.group(), date_format)))
+            except ValueError:
+                continue
+    return [timestamp for _, _, timestamp in sorted(found)]
+
+
+def name_to_timestamp(name: str) -> Union[datetime, None]:
+    """Parse the first timestamp in a (file) name. Returns None if there is none."""
+    return next(iter(name_to_timestamps(name)), None)
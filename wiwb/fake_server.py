@@ -0,0 +1,254 @@
+"""Local stand-in for the WIWB token and API endpoints.
+
+For testing and load-testing clients without wiwb.hydronet.com.
+"""
+
+import json
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import jwt
+import pandas as pd
+import rioxarray  # noqa: F401, registers the rio accessor
+import xarray
+
+from wiwb.netcdf import NETCDF_LOCK
+from wiwb.synthetic import FILL_VALUE, synthetic_dataset
+
+DATA_SOURCE_CODE = "Meteobase.Precipitation"
+WRITE_CHUNK_SIZE = 64 * 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "FakeWiwbServer"
+
+    def _reply(self, content: bytes, content_type: str = "application/json"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        bandwidth = self.server.bandwidth
+        for start in range(0, len(content), WRITE_CHUNK_SIZE):
+            chunk = content[start : start + WRITE_CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if bandwidth:
+                time.sleep(len(chunk) / bandwidth)
+        self.server._count(bytes_sent=len(content))
+
+    def _reply_error(self, status_code: int, retry_after: Union[str, None] = None):
+        self.send_response(status_code)
+        if retry_after is not None:
+            self.send_header("Retry-After", retry_after)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        self.server._count(errors=1)
+
+    def do_POST(self):
+        server = self.server
+        server.client_addresses.append(self.client_address)
+        server._count(requests=1)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if server.latency:
+            time.sleep(server.latency)
+
+        # injected errors
+        if server.failures:
+            self._reply_error(*server.failures.pop(0))
+            return
+        if server.error_rate and (server._random.random() < server.error_rate):
+            self._reply_error(server._random.choice(server.error_status_codes))
+            return
+
+        if self.path.endswith("/token"):
+            token = jwt.encode({"exp": int(time.time()) + server.token_lifetime}, "secret")
+            self._reply(json.dumps({"access_token": token}).encode())
+        elif self.path.endswith("entity/datasources/get"):
+            self._reply(json.dumps({"DataSources": server.data_sources}).encode())
+        elif self.path.endswith("entity/variables/get"):
+            self._reply(json.dumps({"Variables": server.variables}).encode())
+        elif self.path.endswith("grids/get"):
+            try:
+                content = server.grids(json.loads(body))
+            except (KeyError, ValueError):
+                self._reply_error(400)
+                return
+            self._reply(content, "application/octet-stream")
+        else:
+            self._reply_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeWiwbServer(ThreadingHTTPServer):
+    """Local stand-in for the WIWB token, entity/datasources/get, entity/variables/get
+    and grids/get endpoints.
+
+    Grids are served from a dataset with dimensions (time, y, x), sliced by the first
+    reader's StartDate, EndDate and Extent and the VariableCodes of all readers, in the exporter DataFormatCode: netcdf4.cf1p6,
+    netcdf4.cf1p6.zip or geotiff (a zip with a GeoTIFF per timestep).
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset, optional
+        Dataset to serve grids from. By default a synthetic week of hourly "P" grids
+        from 2018-01-01 over the default bounds
+    host : str, optional
+        Host to bind to, by default "127.0.0.1"
+    port : int, optional
+        Port to bind to, by default 0 (any free port)
+    latency : float, optional
+        Seconds to wait before replying to every request, by default 0
+    bandwidth : float, optional
+        Bytes per second to send responses with, by default None (unlimited)
+    error_rate : float, optional
+        Fraction of requests to fail randomly with one of error_status_codes, by default 0
+    error_status_codes : Tuple[int], optional
+        Status codes for randomly failed requests, by default (500, 503)
+    token_lifetime : int, optional
+        Lifetime of issued tokens in seconds, by default 3600
+    seed : int, optional
+        Seed for random errors, by default None
+
+    Attributes
+    ----------
+    url : str
+        Base url of the server, to use as Api.base_url. Tokens are at {url}/token
+    failures : List[Tuple[int, Union[str, None]]]
+        Append (status_code, retry_after) tuples to fail the next requests
+    client_addresses : List[Tuple[str, int]]
+        Client addresses of all requests
+    stats : Dict[str, int]
+        Number of requests, errors and bytes sent
+
+    Examples
+    --------
+    from wiwb import Api, Auth
+    from wiwb.fake_server import FakeWiwbServer
+
+    >>> with FakeWiwbServer(latency=0.1) as server:
+    >>>     auth = Auth(client_id="test", client_secret="test", url=f"{server.url}/token")
+    >>>     api = Api(auth=auth, base_url=server.url)
+    >>>     api.get_data_sources()
+    {'Meteobase.Precipitation': {'PrimaryStructureType': 'Grid'}}
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        dataset: Union[xarray.Dataset, None] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0,
+        bandwidth: Union[float, None] = None,
+        error_rate: float = 0,
+        error_status_codes: Tuple[int] = (500, 503),
+        token_lifetime: int = 3600,
+        seed: Union[int, None] = None,
+    ):
+        super().__init__((host, port), _Handler)
+        if dataset is None:
+            dataset = synthetic_dataset(timesteps=24 * 7)
+        self.dataset = dataset
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status_codes = error_status_codes
+        self.token_lifetime = token_lifetime
+        self.failures: List[Tuple[int, Union[str, None]]] = []
+        self.client_addresses: List[Tuple[str, int]] = []
+        self.stats: Dict[str, int] = {"requests": 0, "errors": 0, "bytes_sent": 0}
+        self._stats_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def data_sources(self) -> Dict:
+        return {DATA_SOURCE_CODE: {"PrimaryStructureType": "Grid"}}
+
+    @property
+    def variables(self) -> Dict:
+        return {i: {"Code": i, "DataSourceCode": DATA_SOURCE_CODE} for i in self.dataset.data_vars if i != "crs"}
+
+    def _count(self, **kwargs):
+        with self._stats_lock:
+            for key, value in kwargs.items():
+                self.stats[key] += value
+
+    def grids(self, body: Dict) -> bytes:
+        """Content of the dataset for a grids/get request body"""
+        settings = body["Readers"][0]["Settings"]
+        start, end = (pd.to_datetime(settings[i], format="%Y%m%d%H%M%S") for i in ["StartDate", "EndDate"])
+        variable_codes = [
+            j for i in body["Readers"] for j in i["Settings"].get("VariableCodes", []) if j in self.variables
+        ]
+        if not variable_codes:
+            raise ValueError(f"VariableCodes not in {list(self.variables)}")
+        ds = self.dataset[variable_codes].sel(time=slice(start, end))
+        if "Extent" in settings:
+            extent = settings["Extent"]
+            ds = ds.sel(
+                x=ds.x[(ds.x >= extent["Xll"]) & (ds.x <= extent["Xur"])],
+                y=ds.y[(ds.y >= extent["Yll"]) & (ds.y <= extent["Yur"])],
+            )
+        crs = None
+        if "crs" in self.dataset:
+            ds["crs"] = self.dataset["crs"]
+            crs = self.dataset.rio.crs
+        data_format_code = body.get("Exporter", {}).get("DataFormatCode")
+
+        encoding = {i: {"_FillValue": FILL_VALUE} for i in variable_codes}
+        # HDF5 is not thread-safe, we write one file at a time, also with clients reading
+        with NETCDF_LOCK, tempfile.TemporaryDirectory() as tmp_dir:
+            nc_file = Path(tmp_dir) / "grids.nc"
+            ds.to_netcdf(nc_file, encoding=encoding)
+            if data_format_code == "netcdf4.cf1p6":
+                return nc_file.read_bytes()
+
+            zip_file = Path(tmp_dir) / "grids.zip"
+            with zipfile.ZipFile(zip_file, "w") as archive:
+                if data_format_code == "netcdf4.cf1p6.zip":
+                    archive.write(nc_file, "grids.nc")
+                else:  # geotiff, a file per variable per timestep
+                    for variable_code in variable_codes:
+                        data_array = ds[variable_code]
+                        if crs is not None:
+                            data_array = data_array.rio.write_crs(crs)
+                        for timestamp in ds["time"].to_index():
+                            tif_file = Path(tmp_dir) / f"{variable_code}_{timestamp:%Y%m%d%H%M%S}.tif"
+                            data_array.sel(time=timestamp).rio.to_raster(tif_file)
+                            archive.write(tif_file, tif_file.name)
+            return zip_file.read_bytes()
+
+    def start(self) -> "FakeWiwbServer":
+        """Serve in a daemon thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self) -> "FakeWiwbServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
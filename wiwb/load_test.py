@@ -0,0 +1,165 @@
+"""Load-test a WIWB client against a (local stand-in of the) WIWB API
+
+Runs a number of requests with a number of concurrent clients sharing one Api and
+reports throughput, p50/p99 latency and bytes/s. Without --base-url a local
+FakeWiwbServer is started with the given latency, bandwidth and error rate:
+
+    python -m wiwb.load_test --endpoint grids --requests 100 --concurrency 10 --latency 0.05
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Dict, Union
+
+import numpy as np
+
+from wiwb.api import Api
+from wiwb.auth import Auth
+from wiwb.fake_server import DATA_SOURCE_CODE, FakeWiwbServer
+
+ENDPOINTS = ["token", "datasources", "variables", "grids"]
+
+
+def run_load_test(
+    api: Api,
+    endpoint: str = "grids",
+    requests: int = 100,
+    concurrency: int = 10,
+    data_source_code: str = DATA_SOURCE_CODE,
+    variable_code: str = "P",
+    start_date: datetime = datetime(2018, 1, 1),
+    hours: int = 24,
+    data_format_code: str = "netcdf4.cf1p6",
+) -> Dict[str, float]:
+    """Run requests to an endpoint with concurrent clients sharing one Api
+
+    Parameters
+    ----------
+    api : Api
+        Api to run requests with. Its session should have a pool_size >= concurrency
+    endpoint : str, optional
+        One of "token", "datasources", "variables" or "grids", by default "grids"
+    requests : int, optional
+        Number of requests, by default 100
+    concurrency : int, optional
+        Number of concurrent clients, by default 10
+    data_source_code, variable_code, start_date, hours, data_format_code : optional
+        GetGrids settings for the grids endpoint. Requests cycle through consecutive
+        periods of `hours` from start_date
+
+    Returns
+    -------
+    Dict[str, float]
+        requests, errors, seconds, requests_per_second, p50_latency, p99_latency (in
+        seconds), bytes and bytes_per_second. Latencies include retries.
+    """
+    if endpoint not in ENDPOINTS:
+        raise ValueError(f"endpoint {endpoint} not in {ENDPOINTS}")
+
+    received = {"bytes": 0}
+    lock = threading.Lock()
+
+    def count_bytes(response, *args, **kwargs):
+        with lock:
+            received["bytes"] += len(response.content)
+
+    def request(i: int):
+        if endpoint == "token":
+            api.auth._get_token()
+        elif endpoint == "datasources":
+            api.get_data_sources()
+        elif endpoint == "variables":
+            api.get_variables()
+        else:
+            start = start_date + timedelta(hours=hours * (i % max(1, 24 * 7 // hours)))
+            api.get_grids(
+                data_source_code=data_source_code,
+                variable_code=variable_code,
+                start_date=start,
+                end_date=start + timedelta(hours=hours - 1),
+                data_format_code=data_format_code,
+            ).run()
+
+    def timed_request(i: int) -> Union[float, None]:
+        start = time.perf_counter()
+        try:
+            request(i)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    api.auth.token  # token before the clock starts
+    api.session.hooks["response"].append(count_bytes)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed_request, range(requests)))
+        seconds = time.perf_counter() - start
+    finally:
+        api.session.hooks["response"].remove(count_bytes)
+
+    succeeded = np.array([i for i in latencies if i is not None])
+    return {
+        "requests": requests,
+        "errors": requests - len(succeeded),
+        "seconds": seconds,
+        "requests_per_second": len(succeeded) / seconds,
+        "p50_latency": float(np.percentile(succeeded, 50)) if len(succeeded) else float("nan"),
+        "p99_latency": float(np.percentile(succeeded, 99)) if len(succeeded) else float("nan"),
+        "bytes": received["bytes"],
+        "bytes_per_second": received["bytes"] / seconds,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="grids")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--data-format-code", default="netcdf4.cf1p6")
+    parser.add_argument("--hours", type=int, default=24, help="hours per grids request")
+    parser.add_argument("--base-url", help="API url, by default a local FakeWiwbServer is started")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0, help="fake server latency in seconds")
+    parser.add_argument("--bandwidth", type=float, default=None, help="fake server bytes/s")
+    parser.add_argument("--error-rate", type=float, default=0, help="fake server error rate")
+    args = parser.parse_args(args)
+
+    if args.base_url is None:
+        server = FakeWiwbServer(latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate)
+    else:
+        server = None
+    with server or nullcontext():
+        if server is not None:
+            auth = Auth(client_id="test", client_secret="test", url=f"{server.url}/token")
+            base_url = server.url
+        else:
+            auth, base_url = None, args.base_url
+        api = Api(
+            auth=auth,
+            base_url=base_url,
+            pool_size=args.concurrency,
+            max_retries=args.max_retries,
+        )
+        result = run_load_test(
+            api,
+            endpoint=args.endpoint,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            hours=args.hours,
+            data_format_code=args.data_format_code,
+        )
+
+    print(f"requests:     {result['requests']} ({result['errors']} failed)")
+    print(f"retries:      {api.session.stats['retries']}")
+    print(f"throughput:   {result['requests_per_second']:.1f} requests/s")
+    print(f"latency:      p50 {result['p50_latency'] * 1000:.1f} ms, p99 {result['p99_latency'] * 1000:.1f} ms")
+    print(f"transfer:     {result['bytes'] / 1e6:.1f} MB, {result['bytes_per_second'] / 1e6:.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Manifest of sampled files for incremental sampling of NetCDF directories"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Union
+
+import pandas as pd
+from geopandas import GeoSeries
+
+
+def geometries_hash(geometries: GeoSeries) -> str:
+    """Hash of geometries, their index and crs"""
+    content = hashlib.sha256()
+    content.update(str(geometries.crs).encode())
+    content.update(json.dumps([str(i) for i in geometries.index]).encode())
+    for geometry in geometries.to_wkb():
+        content.update(geometry)
+    return content.hexdigest()
+
+
+def file_record(nc_file: Path, start, end) -> Dict:
+    """Manifest record of a file: size, mtime and sampled time range"""
+    stat = nc_file.stat()
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "start": None if start is None else pd.Timestamp(start).isoformat(),
+        "end": None if end is None else pd.Timestamp(end).isoformat(),
+    }
+
+
+@dataclass
+class SampleManifest:
+    """Record of files sampled into an output file, stored as json next to the output.
+
+    Attributes
+    ----------
+    path : Path
+        Path of the manifest file
+    settings : Dict
+        Variable, geometry-hash, stats and date-selection the output was sampled with. If
+        these change, all files have to be sampled again.
+    files : Dict[str, Dict]
+        Records (size, mtime_ns, start, end) of sampled files by file name
+    """
+
+    path: Path
+    settings: Dict = field(default_factory=dict)
+    files: Dict[str, Dict] = field(default_factory=dict)
+
+    @staticmethod
+    def manifest_path(output: Path) -> Path:
+        return output.with_name(f"{output.name}.manifest.json")
+
+    @classmethod
+    def load(cls, output: Path) -> "SampleManifest":
+        """Load manifest of an output file, empty if it (or the output) doesn't exist"""
+        path = cls.manifest_path(output)
+        if path.exists() and output.exists():
+            content = json.loads(path.read_text())
+            return cls(path=path, settings=content["settings"], files=content["files"])
+        return cls(path=path)
+
+    @staticmethod
+    def make_settings(
+        variable_code: str,
+        geometries: GeoSeries,
+        stats: Union[str, List[str]],
+        start_date: Union[date, None],
+        end_date: Union[date, None],
+    ) -> Dict:
+        return {
+            "variable_code": variable_code,
+            "geometries": geometries_hash(geometries),
+            "stats": [stats] if isinstance(stats, str) else list(stats),
+            "start_date": None if start_date is None else str(start_date),
+            "end_date": None if end_date is None else str(end_date),
+        }
+
+    def is_changed(self, nc_file: Path) -> bool:
+        """Check if a file is new or changed since it was sampled"""
+        record = self.files.get(nc_file.name)
+        if record is None:
+            return True
+        stat = nc_file.stat()
+        return (record["size"] != stat.st_size) or (record["mtime_ns"] != stat.st_mtime_ns)
+
+    def save(self) -> None:
+        """Write manifest atomically"""
+        temp_path = self.path.with_name(f".{self.path.name}.tmp")
+        temp_path.write_text(json.dumps({"settings": self.settings, "files": self.files}, indent=1))
+        os.replace(temp_path, self.path)
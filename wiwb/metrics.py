@@ -0,0 +1,210 @@
+"""Per-phase timing and byte-count instrumentation
+
+Phases are timed and counted only when metrics are enabled. When disabled, a phase is a
+shared no-op context manager.
+
+Examples
+--------
+import logging
+from wiwb import metrics
+
+>>> logging.basicConfig(level=logging.INFO)
+>>> metrics.enable(metrics.LogExporter())  # log every phase as json
+>>> api.get_grids(...).sample()
+>>> metrics.registry.summary()  # totals per phase
+"""
+
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Union
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PhaseMetrics:
+    """Duration and counts of a phase
+
+    Attributes
+    ----------
+    name : str
+        Name of the phase, e.g. "auth.token", "grids.transfer" or "sample.zonal"
+    seconds : float
+        Duration in seconds
+    bytes : int
+        Bytes transferred, written or decoded
+    cells : int
+        Grid cells processed (timesteps x rows x columns)
+    geometries : int
+        Geometries processed
+    calls : int
+        Number of times the phase ran, 1 for a single phase
+    """
+
+    name: str
+    seconds: float = 0.0
+    bytes: int = 0
+    cells: int = 0
+    geometries: int = 0
+    calls: int = 1
+
+    def add(self, bytes: int = 0, cells: int = 0, geometries: int = 0) -> None:
+        """Add counts to the phase"""
+        self.bytes += bytes
+        self.cells += cells
+        self.geometries += geometries
+
+    def _per_second(self, value: int) -> float:
+        return value / self.seconds if self.seconds > 0 else float("nan")
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self._per_second(self.bytes)
+
+    @property
+    def cells_per_second(self) -> float:
+        return self._per_second(self.cells)
+
+    @property
+    def geometries_per_second(self) -> float:
+        return self._per_second(self.geometries)
+
+    def to_dict(self) -> Dict:
+        return {
+            **asdict(self),
+            "bytes_per_second": self.bytes_per_second,
+            "cells_per_second": self.cells_per_second,
+            "geometries_per_second": self.geometries_per_second,
+        }
+
+
+class _Phase:
+    """Context manager timing a phase and emitting it to the registry on exit"""
+
+    __slots__ = ("registry", "metrics", "start")
+
+    def __init__(self, registry: "MetricsRegistry", name: str):
+        self.registry = registry
+        self.metrics = PhaseMetrics(name)
+
+    def add(self, bytes: int = 0, cells: int = 0, geometries: int = 0) -> None:
+        self.metrics.add(bytes=bytes, cells=cells, geometries=geometries)
+
+    def __enter__(self) -> "_Phase":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.seconds = time.perf_counter() - self.start
+        self.registry.emit(self.metrics)
+
+
+class _NullPhase:
+    """No-op phase, used when metrics are disabled"""
+
+    __slots__ = ()
+
+    def add(self, bytes: int = 0, cells: int = 0, geometries: int = 0) -> None:
+        pass
+
+    def __enter__(self) -> "_NullPhase":
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+@dataclass
+class MetricsRegistry:
+    """Registry of phase metrics. Emitted phases are added to totals per phase name and
+    passed to all callbacks.
+
+    Attributes
+    ----------
+    enabled : bool
+        Time and count phases. By default False
+    callbacks : List[Callable[[PhaseMetrics], None]]
+        Called with the PhaseMetrics of every phase
+    totals : Dict[str, PhaseMetrics]
+        Summed metrics per phase name
+    """
+
+    enabled: bool = False
+    callbacks: List[Callable[[PhaseMetrics], None]] = field(default_factory=list)
+    totals: Dict[str, PhaseMetrics] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def emit(self, metrics: PhaseMetrics) -> None:
+        with self._lock:
+            total = self.totals.setdefault(metrics.name, PhaseMetrics(metrics.name, calls=0))
+            total.seconds += metrics.seconds
+            total.add(bytes=metrics.bytes, cells=metrics.cells, geometries=metrics.geometries)
+            total.calls += metrics.calls
+        for callback in self.callbacks:
+            callback(metrics)
+
+    def reset(self) -> None:
+        """Clear totals"""
+        with self._lock:
+            self.totals.clear()
+
+    def summary(self) -> pd.DataFrame:
+        """Totals per phase as DataFrame"""
+        with self._lock:
+            records = [i.to_dict() for i in self.totals.values()]
+        return pd.DataFrame.from_records(records, columns=list(PhaseMetrics("").to_dict())).set_index("name")
+
+
+class LogExporter:
+    """Callback logging every phase as a json message, with the metrics as dict in the
+    `wiwb_metrics` attribute of the log record for structured log handlers
+
+    Parameters
+    ----------
+    logger : logging.Logger, optional
+        Logger to log to, by default the wiwb.metrics logger
+    level : int, optional
+        Log level, by default logging.INFO
+    """
+
+    def __init__(self, logger: logging.Logger = logger, level: int = logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, metrics: PhaseMetrics) -> None:
+        if self.logger.isEnabledFor(self.level):
+            content = metrics.to_dict()
+            self.logger.log(self.level, json.dumps(content), extra={"wiwb_metrics": content})
+
+
+registry = MetricsRegistry()
+
+
+def phase(name: str) -> Union[_Phase, _NullPhase]:
+    """Context manager timing a phase in the global registry. Add counts with
+    .add(bytes=, cells=, geometries=)
+    """
+    if not registry.enabled:
+        return _NULL_PHASE
+    return _Phase(registry, name)
+
+
+def enable(*callbacks: Callable[[PhaseMetrics], None]) -> MetricsRegistry:
+    """Enable metrics in the global registry, optionally adding callbacks"""
+    registry.callbacks.extend(callbacks)
+    registry.enabled = True
+    return registry
+
+
+def disable() -> None:
+    """Disable metrics in the global registry and remove its callbacks"""
+    registry.enabled = False
+    registry.callbacks.clear()
@@ -0,0 +1,231 @@
+"""Open NetCDF files and read their metadata for sampling"""
+
+import threading
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import netCDF4
+import pandas as pd
+import pyproj
+import rioxarray  # noqa: F401, registers the rio accessor
+import xarray
+from affine import Affine
+
+from wiwb.converters import name_to_timestamps
+
+# netCDF4/HDF5 is not thread-safe. All netCDF4 calls of wiwb, including lazy reads of
+# opened datasets, hold this lock. Hold it too when using netCDF4 in other threads.
+NETCDF_LOCK = threading.RLock()
+
+
+@dataclass(frozen=True)
+class NetCDFHeader:
+    """NetCDF metadata needed for sampling a variable
+
+    Attributes
+    ----------
+    transform : Affine
+        Affine transform of the grid
+    crs : pyproj.CRS or None
+        Coordinate reference system of the grid, None if not specified in the file
+    shape : Tuple[int, int]
+        Number of (rows, cols) in the grid
+    start : pd.Timestamp or None
+        First timestamp in the file, None if file has no time dimension
+    end : pd.Timestamp or None
+        Last timestamp in the file, None if file has no time dimension
+    fill_value : float or None
+        _FillValue of the variable
+    """
+
+    transform: Affine
+    crs: Union[pyproj.CRS, None]
+    shape: Tuple[int, int]
+    start: Union[pd.Timestamp, None]
+    end: Union[pd.Timestamp, None]
+    fill_value: Union[float, None]
+
+
+def _read_crs(ds: xarray.Dataset, variable_code: str) -> Union[pyproj.CRS, None]:
+    """CRS from rioxarray or, if it is a data variable, the CF grid mapping"""
+    if ds.rio.crs is not None:
+        return pyproj.CRS(ds.rio.crs)
+    grid_mapping = ds[variable_code].attrs.get("grid_mapping", ds[variable_code].encoding.get("grid_mapping"))
+    if grid_mapping in ds.variables:
+        return pyproj.CRS.from_cf(ds[grid_mapping].attrs)
+    return None
+
+
+def open_netcdf(source: Union[Path, str, bytes]) -> xarray.Dataset:
+    """Open a NetCDF file, or NetCDF content in memory, as xarray Dataset
+
+    Parameters
+    ----------
+    source : Union[Path, str, bytes]
+        path to NetCDF file or NetCDF file content
+
+    Returns
+    -------
+    xarray.Dataset
+        Lazily loaded dataset, to be closed after use
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        # xarray opens content without a lock, so we hold it
+        with NETCDF_LOCK:
+            try:
+                return xarray.open_dataset(bytes(source), engine="netcdf4", lock=NETCDF_LOCK)
+            except (TypeError, ValueError):  # older xarray only opens paths with netCDF4
+                nc = netCDF4.Dataset("inmemory.nc", memory=bytes(source))
+                store = xarray.backends.NetCDF4DataStore(nc, lock=NETCDF_LOCK)
+                return xarray.open_dataset(store)
+    return xarray.open_dataset(source, engine="netcdf4", lock=NETCDF_LOCK)
+
+
+def dataset_header(ds: xarray.Dataset, variable_code: str) -> NetCDFHeader:
+    """Read the header of an opened NetCDF file.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Dataset opened with open_netcdf
+    variable_code : str
+        Variable in dataset to read the fill value for
+
+    Returns
+    -------
+    NetCDFHeader
+        Transform, crs, shape, time coverage and fill value
+    """
+    # xarray reads data lazily, so we only read attributes and coordinates
+    time = ds["time"].to_numpy() if "time" in ds.dims else []
+    return NetCDFHeader(
+        transform=ds.rio.transform(),
+        crs=_read_crs(ds, variable_code),
+        shape=(ds.rio.height, ds.rio.width),
+        start=pd.Timestamp(time.min()) if len(time) else None,
+        end=pd.Timestamp(time.max()) if len(time) else None,
+        fill_value=ds[variable_code].encoding.get("_FillValue", None),
+    )
+
+
+def _header(source: Union[str, bytes], variable_code: str) -> NetCDFHeader:
+    with open_netcdf(source) as ds:
+        return dataset_header(ds, variable_code)
+
+
+@lru_cache(maxsize=16384)
+def _read_header(nc_file: str, mtime_ns: int, variable_code: str) -> NetCDFHeader:
+    return _header(nc_file, variable_code)
+
+
+def read_header(nc_file: Union[Path, str, bytes], variable_code: str) -> NetCDFHeader:
+    """Read the header of a NetCDF file, cached per path and modification time.
+
+    Parameters
+    ----------
+    nc_file : Union[Path, str, bytes]
+        path to NetCDF file or NetCDF file content. Content is not cached
+    variable_code : str
+        Variable in NetCDF file to read the fill value for
+
+    Returns
+    -------
+    NetCDFHeader
+        Transform, crs, shape, time coverage and fill value
+    """
+    if isinstance(nc_file, (bytes, bytearray, memoryview)):
+        return _header(nc_file, variable_code)
+    nc_file = Path(nc_file)
+    return _read_header(str(nc_file.absolute()), nc_file.stat().st_mtime_ns, variable_code)
+
+
+def clear_header_cache() -> None:
+    """Clear the headers cached by read_header."""
+    _read_header.cache_clear()
+
+
+def file_time_index(nc_files: List[Path], variable_code: str) -> pd.DataFrame:
+    """Time coverage of NetCDF files from timestamps in their names, reading headers only
+    where names don't tell.
+
+    A file named with two or more timestamps, like a GetGrids download, covers the first
+    until the last. A file named with one timestamp, like `..._2015-01-01T000000_...nc`,
+    starts at it and, in a series of consecutive files, ends before the next file starts.
+    The header is read for the last file of such a series and files without a timestamp in
+    their name.
+
+    Parameters
+    ----------
+    nc_files : List[Path]
+        paths to NetCDF files
+    variable_code : str
+        Variable in NetCDF files, to read headers for
+
+    Returns
+    -------
+    pd.DataFrame
+        start and (inclusive) end per file, indexed by path. NaT if unknown
+    """
+    records, series = {}, []
+    for nc_file in nc_files:
+        timestamps = name_to_timestamps(nc_file.name)
+        if len(timestamps) > 1:
+            records[nc_file] = (pd.Timestamp(timestamps[0]), pd.Timestamp(timestamps[-1]))
+        elif timestamps:
+            series.append(nc_file)
+            records[nc_file] = (pd.Timestamp(timestamps[0]), None)
+        else:
+            header = read_header(nc_file, variable_code)
+            records[nc_file] = (header.start, header.end)
+
+    # a file in a series ends before the next file starts
+    starts = pd.DatetimeIndex(sorted({records[i][0] for i in series}))
+    for nc_file in series:
+        start = records[nc_file][0]
+        i = starts.searchsorted(start, side="right")
+        if i < len(starts):
+            end = starts[i] - pd.Timedelta(1, "ns")
+        else:
+            end = read_header(nc_file, variable_code).end
+        records[nc_file] = (start, end)
+
+    return pd.DataFrame.from_dict(records, orient="index", columns=["start", "end"], dtype="datetime64[ns]")
+
+
+def select_files(
+    nc_files: List[Path],
+    variable_code: str,
+    start_date: Union[date, None] = None,
+    end_date: Union[date, None] = None,
+) -> List[Path]:
+    """NetCDF files with timesteps within a (possibly open-ended) start_date and end_date,
+    selected by their file_time_index. Files with unknown time coverage are kept.
+
+    Parameters
+    ----------
+    nc_files : List[Path]
+        paths to NetCDF files
+    variable_code : str
+        Variable in NetCDF files, to read headers for
+    start_date : Union[date, None]
+        start date for selection, by default None
+    end_date: Union[date, None]
+        end date for selection, by default None
+
+    Returns
+    -------
+    List[Path]
+        Selected files, in the order of nc_files
+    """
+    if (start_date is None) and (end_date is None):
+        return list(nc_files)
+    index = file_time_index(nc_files, variable_code)
+    outside = pd.Series(False, index=index.index)
+    if start_date is not None:
+        outside |= index["end"] < pd.Timestamp(start_date)
+    if end_date is not None:
+        outside |= index["start"] > pd.Timestamp(end_date)
+    return [i for i in nc_files if not outside[i]]
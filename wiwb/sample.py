@@ -1,15 +1,55 @@
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import date
+from functools import partial
 from pathlib import Path
-from typing import List, Union
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple, Union
 
 import numpy as np
 import pandas as pd
+import rioxarray  # noqa: F401, registers the rio accessor
 import xarray
 from affine import Affine
 from geopandas import GeoSeries
 from numpy import ndarray
+from rasterio.io import MemoryFile
+from rasterio.windows import Window
 from rasterstats import zonal_stats
-from typing import Union
+
+from wiwb import metrics
+from wiwb.converters import name_to_timestamp
+from wiwb.manifest import SampleManifest, file_record
+from wiwb.netcdf import (
+    clear_header_cache,
+    dataset_header,
+    open_netcdf,
+    read_header,
+    select_files,
+)
+from wiwb.tiles import TILE_SIZE, sample_tiled, tiled_min_cells
+from wiwb.zonal import (
+    LINEAR_STATS,
+    clear_weights_cache,
+    geometry_window,
+    get_zonal_weights,
+    grouped_stats,
+    is_point_stat,
+    outside_cells,
+    sample_points,
+    window_transform,
+)
+
+if TYPE_CHECKING:
+    from wiwb.sinks import ParquetSink
+
+
+def clear_caches() -> None:
+    """Clear the caches of NetCDF headers and geometry weights, e.g. to sample cold."""
+    clear_header_cache()
+    clear_weights_cache()
 
 
 def flatten_stats(stats_dict: List[str], stats: List[str]) -> List[float]:
@@ -40,23 +80,148 @@ def sample_geoseries(
     return flatten_stats(stats_dict, stats)
 
 
+def sample_grids(
+    values: ndarray,
+    geometries: Union[List, GeoSeries],
+    affine: Affine,
+    nodata: float,
+    stats: Union[str, List[str]] = "mean",
+    tile_size: Union[int, None] = None,
+    n_workers: int = 1,
+    memory_budget: Union[int, None] = None,
+) -> ndarray:
+    """Sample a stack of grids with shape (time, rows, cols) over a set of geometries
+
+    Only the window of the grid covering the geometries is sampled. Points are sampled
+    for all timesteps at once by a cell lookup. For other geometries linear statistics
+    (count, sum, mean) are computed for all timesteps at once from a sparse geometry-cell
+    matrix that is rasterized once per grid. Other statistics are computed for all
+    timesteps at once by a grouped reduction over the cells of that matrix or, if these
+    are too many to hold in memory, tile by tile (see wiwb.tiles). Results equal rasterstats.
+
+    Parameters
+    ----------
+    tile_size : Union[int, None], optional
+        Sample other statistics in tiles of tile_size x tile_size cells. By default None,
+        tiles of 512 cells if a grouped reduction over the cells of the geometries over all
+        timesteps does not fit in memory_budget
+    n_workers : int, optional
+        Number of threads to sample tiles in parallel, by default 1
+    memory_budget : Union[int, None], optional
+        Maximum bytes of a grouped reduction over the cells of all geometries and
+        timesteps. By default None, tiles if geometries cover more than 2e7 cells over all
+        timesteps
+
+    Returns
+    -------
+    ndarray
+        Array with shape (time, geometries * stats), stats varying fastest
+    """
+    if isinstance(stats, str):
+        stats = [stats]
+    if not isinstance(geometries, GeoSeries):
+        geometries = GeoSeries(geometries)
+
+    with metrics.phase("sample.zonal") as phase:
+        window = geometry_window(geometries, affine, values.shape[1:])
+        if window is not None:
+            values = values[:, window[0], window[1]]
+            affine = window_transform(affine, window)
+        result = _sample_grids(
+            values, geometries, affine, nodata, stats, tile_size, n_workers, memory_budget
+        )
+        phase.add(cells=values.size, geometries=len(geometries))
+    return result
+
+
+def _sample_grids(
+    values: ndarray,
+    geometries: Union[List, GeoSeries],
+    affine: Affine,
+    nodata: float,
+    stats: List[str],
+    tile_size: Union[int, None] = None,
+    n_workers: int = 1,
+    memory_budget: Union[int, None] = None,
+) -> ndarray:
+    result = np.full((values.shape[0], len(geometries), len(stats)), np.nan)
+
+    # points are sampled by a direct cell lookup if all stats allow it
+    is_point = np.zeros(len(geometries), dtype=bool)
+    if all(is_point_stat(i) for i in stats):
+        is_point = (geometries.geom_type == "Point").to_numpy()
+        if is_point.any():
+            result[:, is_point] = sample_points(
+                values, geometries[is_point], affine, nodata=nodata, stats=stats
+            )
+
+    if is_point.all():
+        return result.reshape(values.shape[0], len(geometries) * len(stats))
+
+    zonal_geometries = geometries[~is_point]
+    zonal_result = np.full((values.shape[0], len(zonal_geometries), len(stats)), np.nan)
+
+    linear_stats = [i for i in stats if i in LINEAR_STATS]
+    other_stats = [i for i in stats if i not in LINEAR_STATS]
+    if linear_stats or (other_stats and tile_size is None):
+        weights = get_zonal_weights(zonal_geometries, affine, values.shape[1:])
+    if linear_stats:
+        zonal_result[:, :, [stats.index(i) for i in linear_stats]] = weights.sample(
+            values, nodata=nodata, stats=linear_stats
+        )
+
+    # tiles bound memory if the cell values of all geometries and timesteps are too many
+    if other_stats and (
+        (tile_size is not None) or (values.shape[0] * weights.matrix.nnz >= tiled_min_cells(memory_budget))
+    ):
+        zonal_result[:, :, [stats.index(i) for i in other_stats]] = sample_tiled(
+            values,
+            zonal_geometries,
+            affine,
+            nodata=nodata,
+            stats=other_stats,
+            tile_size=tile_size or TILE_SIZE,
+            n_workers=n_workers,
+        )
+    elif other_stats:
+        # all timesteps and stats in one grouped reduction over the cells of the geometries
+        other_result = grouped_stats(
+            values.reshape(values.shape[0], -1),
+            weights.matrix.indptr,
+            weights.matrix.indices,
+            nodata=nodata,
+            stats=other_stats,
+        )
+        if "nodata" in other_stats:  # like rasterstats, count cells outside the grid
+            other_result[:, :, other_stats.index("nodata")] += outside_cells(
+                zonal_geometries, affine, values.shape[1:]
+            )
+        zonal_result[:, :, [stats.index(i) for i in other_stats]] = other_result
+
+    result[:, ~is_point] = zonal_result
+    return result.reshape(values.shape[0], len(geometries) * len(stats))
+
+
 def sample_netcdf(
-    nc_file: Union[Path, str],
-    variable_code: str,
+    nc_file: Union[Path, str, bytes],
+    variable_code: Union[str, List[str]],
     geometries: Union[List, GeoSeries],
     stats: Union[str, List[str]] = "mean",
     start_date: Union[date, None] = None,
     end_date: Union[date, None] = None,
     unlink: bool = False,
-) -> pd.DataFrame:
+    memory_budget: Union[int, None] = None,
+    sink: Union["ParquetSink", None] = None,
+) -> Union[pd.DataFrame, "ParquetSink"]:
     """Sample a set of geometries over a netcdf file
 
     Parameters
     ----------
-    nc_file : Path or str
-        path to NetCDF file
-    variable_code : str
-        Variable in NetCDF file to sample
+    nc_file : Path, str or bytes
+        path to NetCDF file, or NetCDF file content to sample in memory
+    variable_code : Union[str, List[str]]
+        Variable in NetCDF file to sample. With a list of variables, all are sampled in one
+        pass with shared geometry masks and columns get a top-level "variable"
     geometries : Union[List, GeoSeries]
         geometries to sample
     stats : List[str]
@@ -67,38 +232,173 @@ def sample_netcdf(
         end date for selection, by default None
     unlink : bool, optional
         option to delete netcdf-file after sampling, by default False
+    memory_budget : Union[int, None], optional
+        Maximum bytes of decoded grids in memory. If a variable doesn't fit, the time axis
+        is sampled in blocks, decoding the next block while sampling the current one.
+        Geometries covering too many cells to reduce within it are sampled in tiles.
+        By default None (decode all timesteps at once)
+    sink : Union[ParquetSink, None], optional
+        sink to write long-format rows to instead of returning a DataFrame, by default None.
+        Only for a single variable
 
     Returns
     -------
-    pd.DataFrame
-        Pandas DataFrame with statistics per timestamp per geometry
+    Union[pd.DataFrame, ParquetSink]
+        Pandas DataFrame with statistics per timestamp per geometry, or sink if specified
     """
+    in_memory = isinstance(nc_file, (bytes, bytearray, memoryview))
     if isinstance(nc_file, str):
-        nc_file = Path(str)
-    assert nc_file.is_file(), f"nc_file {nc_file} does not exist"
+        nc_file = Path(nc_file)
+    if not in_memory:
+        assert nc_file.is_file(), f"nc_file {nc_file} does not exist"
+    if (sink is not None) and not isinstance(variable_code, str):
+        raise ValueError("A sink can only be used for sampling a single variable_code")
 
-    # read temp-source for sampling
-    with xarray.open_dataset(nc_file, engine="netcdf4") as ds:
-        if (start_date is not None) and (end_date is not None):
-            ds = ds.sel(time=slice(start_date, end_date))
-        nodata =  ds[variable_code].encoding.get("_FillValue", None)
-        affine = ds.rio.transform()
-        data = {
-            time: sample_geoseries(
-                values=ds[variable_code].sel(time=time).values,
-                geometries=geometries,
-                affine=affine,
-                nodata=nodata,
-                stats=stats,
-            )
-            for time in ds["time"].values
-        }
+    kwargs = {
+        "nc_file": nc_file,
+        "variable_codes": [variable_code] if isinstance(variable_code, str) else variable_code,
+        "geometries": geometries,
+        "stats": stats,
+        "start_date": start_date,
+        "end_date": end_date,
+        "memory_budget": memory_budget,
+    }
+    if sink is not None:  # write every block of timesteps, so memory stays bounded
+        for _, df in _sample_netcdf_blocks(**kwargs):
+            sink.write(df, stats)
+    else:
+        dfs = _sample_netcdf_variables(**kwargs)
 
     # delete temp-file
-    if unlink:
+    if unlink and not in_memory:
         if nc_file.exists():
             nc_file.unlink()
 
+    if sink is not None:
+        return sink
+    if isinstance(variable_code, str):
+        return dfs[variable_code]
+    return _concat_variables(dfs)
+
+
+def _check_same_grid(ds: xarray.Dataset, variable_codes: List[str]) -> None:
+    """Raise a ValueError if variables are not on the grid of the first variable"""
+    reference = ds[variable_codes[0]]
+    spatial_dims = [reference.rio.y_dim, reference.rio.x_dim]
+    for variable_code in variable_codes[1:]:
+        data_array = ds[variable_code]
+        if not (
+            set(spatial_dims).issubset(data_array.dims)
+            and all(data_array[i].equals(reference[i]) for i in spatial_dims)
+        ):
+            raise ValueError(
+                f"Variables {variable_codes[0]} and {variable_code} are on different grids, "
+                "sample them separately"
+            )
+
+
+def _sample_netcdf_blocks(
+    nc_file: Union[Path, bytes],
+    variable_codes: List[str],
+    geometries: Union[List, GeoSeries],
+    stats: Union[str, List[str]],
+    start_date: Union[date, None],
+    end_date: Union[date, None],
+    memory_budget: Union[int, None] = None,
+) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """Sample variables in a netcdf file, all on the same grid, to a DataFrame per variable
+    per block of timesteps that fits in memory_budget
+    """
+    with open_netcdf(nc_file) as ds:
+        _check_same_grid(ds, variable_codes)
+        header = dataset_header(ds, variable_codes[0])
+        if (start_date is not None) or (end_date is not None):
+            ds = ds.sel(time=slice(start_date, end_date))
+
+        # only read the window covering the geometries from disk
+        transform = header.transform
+        window = geometry_window(geometries, transform, header.shape)
+        if window is not None:
+            ds = ds.isel({ds.rio.y_dim: window[0], ds.rio.x_dim: window[1]})
+            transform = window_transform(transform, window)
+        times = ds["time"].to_numpy()
+        for variable_code in variable_codes:
+            data_array = ds[variable_code].transpose("time", ds.rio.y_dim, ds.rio.x_dim)
+            timestep_bytes = int(np.prod(data_array.shape[1:])) * data_array.dtype.itemsize
+            if (memory_budget is None) or (data_array.nbytes <= memory_budget):
+                block_size = max(len(data_array["time"]), 1)
+            else:  # a block being sampled and the next being decoded fit in memory_budget
+                block_size = max(memory_budget // (2 * timestep_bytes), 1)
+
+            # geometry masks are cached per grid, so shared by all variables and blocks
+            starts = range(0, max(len(times), 1), block_size)
+            for start, grids in zip(starts, _decode_blocks(data_array, block_size)):
+                values = sample_grids(
+                    values=grids,
+                    geometries=geometries,
+                    affine=transform,
+                    nodata=ds[variable_code].encoding.get("_FillValue", None),
+                    stats=stats,
+                    memory_budget=memory_budget,
+                )
+                yield variable_code, _to_dataframe(
+                    dict(zip(times[start : start + len(values)], values)), geometries, stats
+                )
+
+
+def _sample_netcdf_variables(
+    nc_file: Union[Path, bytes],
+    variable_codes: List[str],
+    geometries: Union[List, GeoSeries],
+    stats: Union[str, List[str]],
+    start_date: Union[date, None],
+    end_date: Union[date, None],
+    memory_budget: Union[int, None] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Sample variables in a netcdf file, all on the same grid, to a DataFrame per variable"""
+    dfs = {i: [] for i in variable_codes}
+    for variable_code, df in _sample_netcdf_blocks(
+        nc_file, variable_codes, geometries, stats, start_date, end_date, memory_budget
+    ):
+        dfs[variable_code].append(df)
+    return {i: pd.concat(j) for i, j in dfs.items()}
+
+
+def _decode_blocks(data_array: xarray.DataArray, block_size: int) -> Iterator[ndarray]:
+    """Decode blocks of block_size timesteps of a (time, y, x) DataArray.
+
+    The next block is decoded in a background thread while the current block is processed.
+    """
+
+    def decode(start: int) -> ndarray:
+        with metrics.phase("sample.decode") as phase:
+            grids = data_array.isel(time=slice(start, start + block_size)).to_numpy()
+            phase.add(bytes=grids.nbytes, cells=grids.size)
+        return grids
+
+    starts = list(range(0, len(data_array["time"]), block_size))
+    if len(starts) <= 1:  # nothing to overlap
+        yield decode(0)
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(decode, starts[0])
+        for start in starts[1:]:
+            grids = future.result()
+            future = executor.submit(decode, start)
+            yield grids
+        yield future.result()
+
+
+def _concat_variables(dfs: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """DataFrame with a DataFrame per variable under a top-level "variable" column"""
+    return pd.concat(dfs, axis=1, names=["variable"]).sort_index()
+
+
+def _to_dataframe(
+    data: Dict, geometries: GeoSeries, stats: Union[str, List[str]]
+) -> pd.DataFrame:
+    """DataFrame from sampled {timestamp: values} with geometry (and stats) columns"""
     # create columns
     if isinstance(stats, str):
         stats = [stats]
@@ -114,6 +414,163 @@ def sample_netcdf(
     return pd.DataFrame.from_dict(data, orient="index", columns=columns)
 
 
+def _member_variable_codes(member: str, variable_codes: List[str]) -> List[str]:
+    """Variable codes in the name of a zip-member, as whole words"""
+    name = Path(member).stem
+    return [
+        i
+        for i in variable_codes
+        if re.search(rf"(?<![0-9A-Za-z]){re.escape(i)}(?![0-9A-Za-z])", name) is not None
+    ]
+
+
+def sample_zip(
+    zip_file: Union[Path, str, bytes],
+    variable_code: Union[str, List[str]],
+    geometries: Union[List, GeoSeries],
+    stats: Union[str, List[str]] = "mean",
+    start_date: Union[date, None] = None,
+    end_date: Union[date, None] = None,
+    memory_budget: Union[int, None] = None,
+) -> pd.DataFrame:
+    """Sample a set of geometries over a zip-archive with GeoTIFF or NetCDF files
+
+    Members are read one at a time from the archive into memory, they are not extracted to
+    disk. GeoTIFFs should hold one timestep, with its timestamp in the member name
+    (e.g. P_20180101000000.tif) or in the TIFFTAG_DATETIME tag. GeoTIFFs are sampled for
+    the variable_code in their name, as a whole word (P_20180101000000.tif is not sampled
+    for Pa). If no GeoTIFF names a variable_code, all GeoTIFFs are sampled for a single
+    variable_code. NetCDF members without variable_code in their name are sampled for all
+    variables.
+
+    Parameters
+    ----------
+    zip_file : Path, str or bytes
+        path to zip-file, or zip-file content to sample in memory
+    variable_code : Union[str, List[str]]
+        Variable to sample. With a list of variables, every member is read once and
+        columns get a top-level "variable"
+    geometries : Union[List, GeoSeries]
+        geometries to sample
+    stats : List[str]
+        statistics to sample
+    start_date : Union[date, None]
+        start date for selection, by default None
+    end_date: Union[date, None]
+        end date for selection, by default None
+    memory_budget : Union[int, None], optional
+        Maximum bytes of decoded grids in memory. If a variable in a NetCDF member doesn't fit, the time axis
+        is sampled in blocks, decoding the next block while sampling the current one.
+        By default None (decode all timesteps at once)
+
+    Returns
+    -------
+    pd.DataFrame
+        Pandas DataFrame with statistics per timestamp per geometry
+    """
+    if isinstance(zip_file, (bytes, bytearray, memoryview)):
+        zip_file = io.BytesIO(zip_file)
+    variable_codes = [variable_code] if isinstance(variable_code, str) else variable_code
+
+    dfs = {i: [] for i in variable_codes}
+    data = {i: {} for i in variable_codes}
+    with zipfile.ZipFile(zip_file) as archive:
+        members = [i for i in archive.namelist() if not i.endswith("/")]
+        variable_members = {i: [] for i in variable_codes}
+        for member in members:
+            member_codes = _member_variable_codes(member, variable_codes)
+            if (not member_codes) and (Path(member).suffix.lower() == ".nc"):
+                member_codes = variable_codes
+            for code in member_codes:
+                variable_members[code].append(member)
+
+        # GeoTIFFs without variable_code in their name hold the only variable requested
+        tif_members = [i for i in members if Path(i).suffix.lower() in [".tif", ".tiff"]]
+        if (len(variable_codes) == 1) and not any(
+            _member_variable_codes(i, variable_codes) for i in tif_members
+        ):
+            variable_members[variable_codes[0]] += tif_members
+        for code, code_members in variable_members.items():
+            if not code_members:
+                raise ValueError(f"No NetCDF or GeoTIFF files for {code} in {members}")
+
+        for member in sorted(members):
+            member_codes = [i for i in variable_codes if member in variable_members[i]]
+            if not member_codes:
+                continue
+            suffix = Path(member).suffix.lower()
+            if suffix == ".nc":
+                member_dfs = _sample_netcdf_variables(
+                    archive.read(member),
+                    member_codes,
+                    geometries,
+                    stats=stats,
+                    start_date=start_date,
+                    end_date=end_date,
+                    memory_budget=memory_budget,
+                )
+                for code, df in member_dfs.items():
+                    dfs[code].append(df)
+            elif suffix in [".tif", ".tiff"]:
+                with MemoryFile(archive.read(member)) as memory_file:
+                    with memory_file.open() as src:
+                        time = name_to_timestamp(Path(member).name)
+                        if (time is None) and ("TIFFTAG_DATETIME" in src.tags()):
+                            time = pd.to_datetime(
+                                src.tags()["TIFFTAG_DATETIME"], format="%Y:%m:%d %H:%M:%S"
+                            )
+                        if time is None:
+                            raise ValueError(f"No timestamp in name or tags of {member}")
+                        time = pd.Timestamp(time)
+                        if (start_date is not None) and (time < pd.Timestamp(start_date)):
+                            continue
+                        if (end_date is not None) and (time > pd.Timestamp(end_date)):
+                            continue
+                        transform = src.transform
+                        window = geometry_window(geometries, transform, src.shape)
+                        with metrics.phase("sample.decode") as phase:
+                            if window is None:
+                                grid = src.read(1)
+                            else:
+                                grid = src.read(1, window=Window.from_slices(*window))
+                                transform = window_transform(transform, window)
+                            phase.add(bytes=grid.nbytes, cells=grid.size)
+                        values = sample_grids(
+                            values=grid[np.newaxis],
+                            geometries=geometries,
+                            affine=transform,
+                            nodata=src.nodata,
+                            stats=stats,
+                            memory_budget=memory_budget,
+                        )[0]
+                        for code in member_codes:
+                            data[code][time] = values
+
+    for code in variable_codes:
+        if data[code]:
+            dfs[code].append(_to_dataframe(data[code], geometries, stats))
+        if not dfs[code]:
+            raise ValueError(f"No NetCDF or GeoTIFF files to sample for {code}")
+    dfs = {code: pd.concat(dfs[code]).sort_index() for code in variable_codes}
+
+    if isinstance(variable_code, str):
+        return dfs[variable_code]
+    return _concat_variables(dfs)
+
+
+# geometries shipped once to every worker process by _init_worker
+_worker_geometries = None
+
+
+def _init_worker(geometries: GeoSeries) -> None:
+    global _worker_geometries
+    _worker_geometries = geometries
+
+
+def _sample_netcdf_worker(nc_file: Path, variable_code: str, **kwargs) -> pd.DataFrame:
+    return sample_netcdf(nc_file, variable_code, _worker_geometries, **kwargs)
+
+
 def sample_netcdfs(
     nc_files: list[Path],
     variable_code: str,
@@ -121,9 +578,15 @@ def sample_netcdfs(
     stats: Union[str, List[str]] = "mean",
     start_date: Union[date, None] = None,
     end_date: Union[date, None] = None,
-):
+    n_workers: int = 1,
+    memory_budget: Union[int, None] = None,
+    sink: Union["ParquetSink", None] = None,
+) -> Union[pd.DataFrame, "ParquetSink"]:
     """Sample over a set of netcdf-files
 
+    Files entirely before start_date or after end_date are skipped without opening them,
+    using the timestamps in their names (see wiwb.netcdf.file_time_index).
+
     Parameters
     ----------
     nc_files : list[Path]
@@ -138,44 +601,86 @@ def sample_netcdfs(
         start date for selection, by default None
     end_date: Union[date, None]
         end date for selection, by default None
+    n_workers : int, optional
+        number of processes to sample files in parallel, by default 1 (no parallel sampling)
+    memory_budget : Union[int, None], optional
+        Maximum bytes of decoded grids in memory per file (process). If a variable doesn't fit, the time axis
+        is sampled in blocks, decoding the next block while sampling the current one.
+        By default None (decode all timesteps at once)
+    sink : Union[ParquetSink, None], optional
+        sink to write long-format rows to after every file instead of returning a
+        DataFrame, so only one file is kept in memory. By default None
 
     Returns
-    ------
-    pd.DataFrame
-        Pandas DataFrame with statistics per timestamp per geometry
+    -------
+    Union[pd.DataFrame, ParquetSink]
+        Pandas DataFrame with statistics per timestamp per geometry, or sink if specified
     """
-    assert nc_files, f"no NetCDF files to sample"
+    assert nc_files, "no NetCDF files to sample"
     for nc_file in nc_files:
         assert nc_file.is_file(), f"nc_file {nc_file} does not exist"
 
-    # read all transforms to see if dataset is consistent
-    transforms = list(
-        set(xarray.open_dataset(file).rio.transform() for file in nc_files)
-    )
+    # skip files outside start_date and end_date without opening them
+    nc_files = select_files(nc_files, variable_code, start_date, end_date)
+    if not nc_files:
+        return sink if sink is not None else _to_dataframe({}, geometries, stats)
+
+    # read all headers (cached for sampling) to see if dataset is consistent
+    headers = [read_header(nc_file, variable_code) for nc_file in nc_files]
+    transforms = list({i.transform for i in headers})
     if len(transforms) == 1:
-        with xarray.open_dataset(nc_files[0], decode_coords="all") as ds:
-            geometries = geometries.to_crs(ds.rio.crs)
+        if headers[0].crs is not None:
+            with metrics.phase("reproject") as phase:
+                geometries = geometries.to_crs(headers[0].crs)
+                phase.add(geometries=len(geometries))
     else:
         raise ValueError(
             f"Files do not have one consistent transform. Got {transforms}"
         )
 
-    dfs = [
-        sample_netcdf(
-            nc_file,
-            variable_code,
-            geometries,
-            stats=stats,
-            start_date=start_date,
-            end_date=end_date,
-            unlink=False,
-        )
-        for nc_file in nc_files
-    ]
-    dfs = [i for i in dfs if not i.empty]
-    df = pd.concat(dfs).sort_index()
+    kwargs = {
+        "stats": stats,
+        "start_date": start_date,
+        "end_date": end_date,
+        "unlink": False,
+        "memory_budget": memory_budget,
+    }
 
-    return df
+    def collect(results) -> Union[pd.DataFrame, "ParquetSink"]:
+        dfs = []
+        for df in results:
+            if df.empty:
+                continue
+            if sink is not None:
+                sink.write(df, stats)
+            else:
+                dfs.append(df)
+        if sink is not None:
+            return sink
+        if not dfs:  # nothing sampled within start_date and end_date
+            return _to_dataframe({}, geometries, stats)
+        return pd.concat(dfs).sort_index()
+
+    if n_workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_worker, initargs=(geometries,)
+        ) as executor:
+            return collect(
+                executor.map(
+                    partial(_sample_netcdf_worker, variable_code=variable_code, **kwargs),
+                    nc_files,
+                    chunksize=max(1, len(nc_files) // (4 * n_workers)),
+                )
+            )
+    elif sink is not None:  # written per block of timesteps
+        for nc_file in nc_files:
+            sample_netcdf(nc_file, variable_code, geometries, sink=sink, **kwargs)
+        return sink
+    else:
+        return collect(
+            sample_netcdf(nc_file, variable_code, geometries, **kwargs)
+            for nc_file in nc_files
+        )
 
 
 def sample_nc_dir(
@@ -185,9 +690,16 @@ def sample_nc_dir(
     stats: Union[str, List[str]] = "mean",
     start_date: Union[date, None] = None,
     end_date: Union[date, None] = None,
-):
+    n_workers: int = 1,
+    memory_budget: Union[int, None] = None,
+    sink: Union["ParquetSink", None] = None,
+    output: Union[Path, str, None] = None,
+) -> Union[pd.DataFrame, "ParquetSink"]:
     """Sample over a directory of netcdf-files
 
+    Files entirely before start_date or after end_date are skipped without opening them,
+    using the timestamps in their names (see wiwb.netcdf.file_time_index).
+
     Parameters
     ----------
     dir_path : Union[Path, str]
@@ -202,11 +714,25 @@ def sample_nc_dir(
         start date for selection, by default None
     end_date: Union[date, None]
         end date for selection, by default None
+    n_workers : int, optional
+        number of processes to sample files in parallel, by default 1 (no parallel sampling)
+    memory_budget : Union[int, None], optional
+        Maximum bytes of decoded grids in memory per file (process). If a variable doesn't fit, the time axis
+        is sampled in blocks, decoding the next block while sampling the current one.
+        By default None (decode all timesteps at once)
+    sink : Union[ParquetSink, None], optional
+        sink to write long-format rows to after every file instead of returning a
+        DataFrame, so only one file is kept in memory. By default None
+    output : Union[Path, str, None], optional
+        Parquet file to store the result in for incremental sampling. Sampled files are
+        recorded in a manifest next to the output, so on the next call only new or changed
+        files are sampled and merged into the stored result. Rows of files removed from
+        the directory are dropped. Requires pyarrow. By default None
 
     Returns
-    ------
-    pd.DataFrame
-        Pandas DataFrame with statistics per timestamp per geometry
+    -------
+    Union[pd.DataFrame, ParquetSink]
+        Pandas DataFrame with statistics per timestamp per geometry, or sink if specified
     """
     if isinstance(dir_path, str):
         dir_path = Path(dir_path)
@@ -214,6 +740,21 @@ def sample_nc_dir(
 
     nc_files = [x for x in dir_path.iterdir() if x.suffix == ".nc"]
 
+    if output is not None:
+        if sink is not None:
+            raise ValueError("Specify either sink or output, not both")
+        return _sample_incremental(
+            nc_files,
+            output=Path(output),
+            variable_code=variable_code,
+            geometries=geometries,
+            stats=stats,
+            start_date=start_date,
+            end_date=end_date,
+            n_workers=n_workers,
+            memory_budget=memory_budget,
+        )
+
     df = sample_netcdfs(
         nc_files,
         variable_code=variable_code,
@@ -221,5 +762,73 @@ def sample_nc_dir(
         stats=stats,
         start_date=start_date,
         end_date=end_date,
+        n_workers=n_workers,
+        memory_budget=memory_budget,
+        sink=sink,
+    )
+    return df
+
+
+def _sample_incremental(
+    nc_files: List[Path],
+    output: Path,
+    variable_code: str,
+    geometries: GeoSeries,
+    stats: Union[str, List[str]],
+    start_date: Union[date, None],
+    end_date: Union[date, None],
+    n_workers: int,
+    memory_budget: Union[int, None],
+) -> pd.DataFrame:
+    """Sample only new or changed files and merge them into the result stored in output"""
+    assert nc_files, "no NetCDF files to sample"
+    nc_files = select_files(nc_files, variable_code, start_date, end_date)
+    settings = SampleManifest.make_settings(
+        variable_code, geometries, stats, start_date, end_date
     )
+    manifest = SampleManifest.load(output)
+    if manifest.settings == settings:
+        df = pd.read_parquet(output)
+    else:
+        manifest = SampleManifest(path=manifest.path, settings=settings)
+        df = None
+
+    # drop rows of changed and removed files
+    file_names = [i.name for i in nc_files]
+    changed_files = [i for i in nc_files if manifest.is_changed(i)]
+    outdated = [i for i in manifest.files if i not in file_names] + [
+        i.name for i in changed_files if i.name in manifest.files
+    ]
+    for file_name in outdated:
+        record = manifest.files.pop(file_name)
+        if record["start"] is not None:
+            df = df.loc[(df.index < record["start"]) | (df.index > record["end"])]
+
+    if changed_files:
+        new_df = sample_netcdfs(
+            changed_files,
+            variable_code=variable_code,
+            geometries=geometries,
+            stats=stats,
+            start_date=start_date,
+            end_date=end_date,
+            n_workers=n_workers,
+            memory_budget=memory_budget,
+        )
+        if df is None:
+            df = new_df
+        elif not new_df.empty:
+            df = pd.concat([df, new_df]).sort_index()
+        for nc_file in changed_files:
+            header = read_header(nc_file, variable_code)
+            manifest.files[nc_file.name] = file_record(nc_file, header.start, header.end)
+    if df is None:  # no files within start_date and end_date
+        df = _to_dataframe({}, geometries, stats)
+
+    if changed_files or outdated:
+        temp_output = output.with_name(f".{output.name}.tmp")
+        df.to_parquet(temp_output)
+        os.replace(temp_output, output)
+        manifest.save()
+
     return df
@@ -0,0 +1,194 @@
+"""Pooled HTTP session shared by all WIWB requests"""
+
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from wiwb.constants import (
+    BACKOFF_FACTOR,
+    BACKOFF_MAX,
+    MAX_RETRIES,
+    POOL_SIZE,
+    RETRY_STATUS_CODES,
+    TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token-bucket rate limiter.
+
+    Parameters
+    ----------
+    rate : float
+        Sustained number of requests per second
+    burst : int, optional
+        Maximum number of requests that can be made at once after being idle. By default 1
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError(f"rate should be > 0, got {rate}")
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"rate": self.rate, "burst": self.burst}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def acquire(self) -> float:
+        """Take a token, waiting for one if the bucket is empty. Returns seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def retry_after(response: requests.Response) -> Union[float, None]:
+    """Seconds to wait according to a Retry-After header, None if not specified"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+class Session(requests.Session):
+    """HTTP session with a connection pool, retries and rate limiting for the WIWB API.
+
+    Connections to WIWB hosts are kept alive and re-used, saving a TCP and TLS handshake
+    on every request. Requests failing with a connection error or status code in
+    (429, 500, 502, 503, 504) are retried with exponential backoff and jitter, honouring a
+    Retry-After header up to backoff_max.
+
+    Parameters
+    ----------
+    pool_size : int
+        Number of connections kept alive per host. By default 10.
+    keep_alive : bool
+        Keep connections alive between requests. By default True.
+    timeout : Union[float, Tuple[float, float]]
+        Default timeout, in seconds, as a float or (connect, read) tuple, for requests that
+        do not specify a timeout. By default (10, 300).
+    max_retries : int
+        Maximum number of retries per request. By default 3.
+    backoff_factor : float
+        Retry n waits a random time up to backoff_factor * 2**n seconds. By default
+        0.5.
+    backoff_max : float
+        Maximum time in seconds to wait between retries, also if a Retry-After header
+        specifies a longer time. By default 60.
+    rate_limit : float, optional
+        Maximum sustained number of requests per second. By default None (no limit).
+    rate_burst : int
+        Number of requests that can be made at once within the rate_limit. By default 1.
+
+    Attributes
+    ----------
+    stats : Dict[str, Union[int, float]]
+        Number of requests and retries, seconds waited for retries and for the rate limit
+    """
+
+    __attrs__ = requests.Session.__attrs__ + [
+        "timeout",
+        "max_retries",
+        "backoff_factor",
+        "backoff_max",
+        "rate_limiter",
+        "stats",
+    ]
+
+    def __init__(
+        self,
+        pool_size: int = POOL_SIZE,
+        keep_alive: bool = True,
+        timeout: Union[float, Tuple[float, float], None] = TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        backoff_factor: float = BACKOFF_FACTOR,
+        backoff_max: float = BACKOFF_MAX,
+        rate_limit: Union[float, None] = None,
+        rate_burst: int = 1,
+    ):
+        super().__init__()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.rate_limiter = None
+        if rate_limit is not None:
+            self.rate_limiter = RateLimiter(rate_limit, burst=rate_burst)
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "retry_wait": 0.0,
+            "rate_limit_wait": 0.0,
+        }
+        self._stats_lock = threading.Lock()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        if not keep_alive:
+            self.headers["Connection"] = "close"
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **increments: Union[int, float]) -> None:
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def backoff(self, retry: int) -> float:
+        """Random backoff time (full jitter) for a retry"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * 2**retry))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        for retry in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self._count(rate_limit_wait=self.rate_limiter.acquire())
+            self._count(requests=1)
+
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if retry == self.max_retries:
+                    raise
+                wait = self.backoff(retry)
+                logger.warning(f"{method} {url} failed ({e}), retry in {wait:.1f}s")
+            else:
+                if (response.status_code not in RETRY_STATUS_CODES) or (retry == self.max_retries):
+                    return response
+                wait = retry_after(response)
+                if wait is None:
+                    wait = self.backoff(retry)
+                else:  # a server asking for longer waits is not blocking us for hours
+                    wait = min(wait, self.backoff_max)
+                response.close()
+                logger.warning(f"{method} {url} returned {response.status_code}, retry in {wait:.1f}s")
+
+            self._count(retries=1, retry_wait=wait)
+            time.sleep(wait)
@@ -0,0 +1,155 @@
+"""Write sampled statistics incrementally to disk"""
+
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+
+LONG_COLUMNS = ["time", "geometry", "stat", "value"]
+GEOMETRY_DTYPE_KEY = b"wiwb.geometry_dtype"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Writing samples to Parquet requires pyarrow: pip install wiwb[parquet]") from e
+    return pyarrow
+
+
+def to_long(df: pd.DataFrame, stats: Union[str, List[str]]) -> pd.DataFrame:
+    """Convert a sampled (wide) DataFrame to long-format rows: time, geometry, stat, value
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame with statistics per timestamp (index) per geometry (columns), as returned
+        by wiwb.sample functions
+    stats : Union[str, List[str]]
+        statistics in df
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with columns time, geometry, stat and value
+    """
+    if isinstance(stats, str):
+        stats = [stats]
+
+    if isinstance(df.columns, pd.MultiIndex):
+        columns = df.columns
+    else:
+        columns = pd.MultiIndex.from_product([df.columns, stats])
+
+    return pd.DataFrame(
+        {
+            "time": df.index.repeat(len(columns)),
+            "geometry": np.tile(columns.get_level_values(0), len(df)),
+            "stat": np.tile(columns.get_level_values(1), len(df)),
+            "value": df.to_numpy(dtype=float).ravel(),
+        }
+    )
+
+
+def to_wide(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert long-format rows back to a DataFrame as returned by wiwb.sample functions"""
+    geometries = pd.unique(df["geometry"])
+    stats = pd.unique(df["stat"])
+    wide = df.pivot_table(index="time", columns=["geometry", "stat"], values="value", aggfunc="first", dropna=False)
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([geometries, stats])).sort_index()
+    wide.index.name = None
+
+    if len(stats) == 1:
+        wide.columns = wide.columns.get_level_values(0)
+        wide.columns.name = None
+    else:
+        wide.columns.names = ["index", "stats"]
+    return wide
+
+
+class ParquetSink:
+    """Write sampled statistics incrementally as long-format rows to a Parquet dataset.
+
+    Every write adds files to the dataset, so memory is bounded by the DataFrame written.
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    path : Union[Path, str]
+        Directory of the Parquet dataset
+    partition_cols : List[str], optional
+        Columns to partition the dataset on (hive-style). Besides the long-format columns
+        "year" and "month" can be used. By default ["year"]. Use [] to not partition
+
+    Examples
+    --------
+    from wiwb.sample import sample_nc_dir
+    from wiwb.sinks import ParquetSink
+
+    >>> sink = sample_nc_dir(dir, variable, GEOSERIES, sink=ParquetSink("samples"))
+    >>> df = sink.read() # read back as DataFrame
+    """
+
+    def __init__(self, path: Union[Path, str], partition_cols: Union[List[str], None] = None):
+        self.pyarrow = _import_pyarrow()
+        self.path = Path(path)
+        self.partition_cols = ["year"] if partition_cols is None else list(partition_cols)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.rows_written = 0
+
+    def write(self, df: pd.DataFrame, stats: Union[str, List[str]]) -> None:
+        """Append a sampled (wide) DataFrame to the dataset"""
+        if df.empty:
+            return
+        long = to_long(df, stats)
+        geometry_dtype = str(long["geometry"].dtype)
+        long["geometry"] = long["geometry"].astype(str)
+        for col in self.partition_cols:
+            if col in ["year", "month"]:
+                long[col] = getattr(pd.DatetimeIndex(long["time"]), col)
+
+        # geometries are stored as strings, their dtype is restored by read_parquet
+        table = self.pyarrow.Table.from_pandas(long, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, GEOMETRY_DTYPE_KEY: geometry_dtype.encode()})
+        self.pyarrow.parquet.write_to_dataset(table, root_path=self.path, partition_cols=self.partition_cols or None)
+        self.rows_written += len(long)
+
+    def read(self, **kwargs) -> pd.DataFrame:
+        """Read the dataset as a DataFrame with statistics per timestamp per geometry.
+
+        Keyword arguments are passed to pandas.read_parquet, e.g. filters=[("year", "=", 2015)]
+        """
+        return read_parquet(self.path, **kwargs)
+
+
+def read_parquet(path: Union[Path, str], **kwargs) -> pd.DataFrame:
+    """Read a Parquet dataset written by ParquetSink as DataFrame with statistics per
+    timestamp per geometry.
+
+    Parameters
+    ----------
+    path : Union[Path, str]
+        Directory of the Parquet dataset
+    **kwargs
+        Passed to pandas.read_parquet, e.g. filters=[("year", "=", 2015)]
+
+    Returns
+    -------
+    pd.DataFrame
+        Pandas DataFrame with statistics per timestamp per geometry
+    """
+    pyarrow = _import_pyarrow()
+    df = to_wide(pd.read_parquet(path, columns=LONG_COLUMNS, **kwargs))
+
+    # restore the dtype of geometries, written as strings
+    metadata = pyarrow.parquet.ParquetDataset(path).schema.metadata or {}
+    geometry_dtype = metadata.get(GEOMETRY_DTYPE_KEY)
+    if geometry_dtype is not None:
+        geometry_dtype = geometry_dtype.decode()
+        if isinstance(df.columns, pd.MultiIndex):
+            df.columns = df.columns.set_levels(df.columns.levels[0].astype(geometry_dtype), level=0)
+        else:
+            df.columns = df.columns.astype(geometry_dtype)
+    return df
@@ -0,0 +1,188 @@
+"""Synthetic grids and geometries for testing and benchmarking"""
+
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+import xarray
+from geopandas import GeoSeries
+from shapely.geometry import MultiPolygon, Point, box
+
+from wiwb.constants import get_defaults
+
+CRS = pyproj.CRS.from_epsg(28992)
+FILL_VALUE = -9999.0
+GEOMETRY_KINDS = ["points", "polygons", "multipolygons", "catchments"]
+
+
+def synthetic_dataset(
+    variable_code: str = "P",
+    bounds: Tuple[float, float, float, float] = get_defaults().bounds,
+    cell_size: float = 1000,
+    timesteps: int = 24,
+    start: Union[str, pd.Timestamp] = "2018-01-01",
+    freq: str = "h",
+    nodata_fraction: float = 0.0,
+    seed: int = 0,
+) -> xarray.Dataset:
+    """CF-1.6 Dataset with random float32 values on a grid in EPSG:28992
+
+    Parameters
+    ----------
+    variable_code : str, optional
+        Name of the variable, by default "P"
+    bounds : Tuple[float, float, float, float], optional
+        Bounds (xmin, ymin, xmax, ymax) of the grid, by default the default bounds
+    cell_size : float, optional
+        Cell size in meters, by default 1000
+    timesteps : int, optional
+        Number of timesteps, by default 24
+    start : Union[str, pd.Timestamp], optional
+        First timestamp, by default "2018-01-01"
+    freq : str, optional
+        Frequency of timesteps, by default "h"
+    nodata_fraction : float, optional
+        Fraction of cells set to the _FillValue, by default 0.0
+    seed : int, optional
+        Seed of the random generator, by default 0
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with dimensions (time, y, x) and a crs grid mapping variable
+    """
+    xmin, ymin, xmax, ymax = bounds
+    x = np.arange(xmin, xmax, cell_size) + cell_size / 2
+    y = np.arange(ymax, ymin, -cell_size) - cell_size / 2
+    time = pd.date_range(start, periods=timesteps, freq=freq)
+
+    rng = np.random.default_rng(seed)
+    values = rng.random((len(time), len(y), len(x)), dtype=np.float32)
+    if nodata_fraction:
+        values[rng.random(values.shape) < nodata_fraction] = np.nan
+
+    crs_attrs = CRS.to_cf()
+    crs_attrs["spatial_ref"] = crs_attrs["crs_wkt"]
+    crs_attrs["EPSG_code"] = "EPSG:28992"
+    ds = xarray.Dataset(
+        {
+            variable_code: (("time", "y", "x"), values, {"grid_mapping": "crs"}),
+            "crs": ((), np.int32(0), crs_attrs),
+        },
+        coords={
+            "time": ("time", time, {"standard_name": "time", "axis": "T"}),
+            "y": ("y", y, {"standard_name": "projection_y_coordinate", "units": "m", "axis": "Y"}),
+            "x": ("x", x, {"standard_name": "projection_x_coordinate", "units": "m", "axis": "X"}),
+        },
+        attrs={"Conventions": "CF-1.6"},
+    )
+    return ds
+
+
+def write_netcdf(ds: xarray.Dataset, nc_file: Union[Path, str]) -> Path:
+    """Write a synthetic dataset with a _FillValue for all data variables"""
+    nc_file = Path(nc_file)
+    encoding = {i: {"_FillValue": FILL_VALUE} for i in ds.data_vars if i != "crs"}
+    ds.to_netcdf(nc_file, encoding=encoding)
+    return nc_file
+
+
+def write_netcdfs(
+    directory: Union[Path, str],
+    n_files: int = 10,
+    variable_code: str = "P",
+    timesteps: int = 24,
+    start: Union[str, pd.Timestamp] = "2018-01-01",
+    freq: str = "h",
+    **kwargs,
+) -> List[Path]:
+    """Write a directory of consecutive synthetic NetCDF files, named like WIWB downloads
+
+    Files are named {variable_code}_{start:%Y-%m-%dT%H%M%S}_{xmin}_{ymax}_{xmax}_{ymin}.nc.
+    Keyword arguments are passed to synthetic_dataset.
+
+    Returns
+    -------
+    List[Path]
+        Paths of the written files
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    bounds = kwargs.get("bounds", get_defaults().bounds)
+    starts = pd.date_range(start, periods=n_files * timesteps, freq=freq)[::timesteps]
+    seed = kwargs.pop("seed", 0)
+
+    nc_files = []
+    for i, file_start in enumerate(starts):
+        ds = synthetic_dataset(
+            variable_code=variable_code,
+            timesteps=timesteps,
+            start=file_start,
+            freq=freq,
+            seed=seed + i,
+            **kwargs,
+        )
+        xmin, ymin, xmax, ymax = bounds
+        file_name = f"{variable_code}_{file_start:%Y-%m-%dT%H%M%S}_{xmin}_{ymax}_{xmax}_{ymin}.nc"
+        nc_files.append(write_netcdf(ds, directory / file_name))
+    return nc_files
+
+
+def synthetic_geometries(
+    kind: str = "polygons",
+    n: int = 100,
+    bounds: Tuple[float, float, float, float] = get_defaults().bounds,
+    size: float = 2000,
+    seed: int = 0,
+) -> GeoSeries:
+    """Random geometries in EPSG:28992 within bounds
+
+    Parameters
+    ----------
+    kind : str, optional
+        One of:
+        - "points": random points
+        - "polygons": random squares with sides of `size`
+        - "multipolygons": pairs of random squares with sides of `size`
+        - "catchments": n polygons tessellating the bounds, like a set of catchments
+        By default "polygons"
+    n : int, optional
+        Number of geometries, by default 100
+    bounds : Tuple[float, float, float, float], optional
+        Bounds (xmin, ymin, xmax, ymax) of the geometries, by default the default bounds
+    size : float, optional
+        Size of polygons in meters, by default 2000
+    seed : int, optional
+        Seed of the random generator, by default 0
+
+    Returns
+    -------
+    GeoSeries
+        GeoSeries with index "geometry_0" ... "geometry_{n-1}"
+    """
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = bounds
+    xs = rng.uniform(xmin + size, xmax - size, n)
+    ys = rng.uniform(ymin + size, ymax - size, n)
+
+    if kind == "points":
+        geometries = [Point(x, y) for x, y in zip(xs, ys)]
+    elif kind == "polygons":
+        geometries = [box(x, y, x + size, y + size) for x, y in zip(xs, ys)]
+    elif kind == "multipolygons":
+        dxs, dys = rng.uniform(-4 * size, 4 * size, (2, n))
+        geometries = [
+            MultiPolygon([box(x, y, x + size, y + size), box(x + dx, y + dy, x + dx + size, y + dy + size)])
+            for x, y, dx, dy in zip(xs, ys, dxs, dys)
+        ]
+    elif kind == "catchments":
+        extent = box(*bounds)
+        cells = shapely.voronoi_polygons(shapely.multipoints(np.column_stack([xs, ys])), extend_to=extent)
+        geometries = [i.intersection(extent) for i in shapely.get_parts(cells)]
+    else:
+        raise ValueError(f"kind {kind} not in {GEOMETRY_KINDS}")
+
+    return GeoSeries(geometries, index=[f"geometry_{i}" for i in range(n)], crs=CRS)
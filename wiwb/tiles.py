@@ -0,0 +1,200 @@
+"""Tiled zonal statistics for large sets of geometries
+
+The grid is partitioned into tiles of tile_size x tile_size cells. Geometries are matched
+to the tiles they intersect with an STRtree, so every tile is sampled with only its own
+geometries. Geometries within one tile are sampled by that tile in one grouped reduction.
+Of a geometry spanning tiles, every tile returns the values of its cells in that tile and
+statistics are computed after merging these partials.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+import shapely
+from affine import Affine
+from geopandas import GeoSeries
+from numpy import ndarray
+
+from wiwb.zonal import _geometry_cells, grouped_stats, outside_cells, window_transform
+
+TILE_SIZE = 512
+TILED_MIN_CELLS = 2 * 10**7  # cell values of geometries over all timesteps
+CELL_BYTES = 32  # peak bytes per cell value of a grouped reduction: values, sort order, sorted
+
+
+def tiled_min_cells(memory_budget: Union[int, None] = None) -> int:
+    """Return the number of cell values over all timesteps from which to sample in tiles.
+
+    A grouped reduction over more cell values than this does not fit in memory_budget. By
+    default TILED_MIN_CELLS.
+    """
+    if memory_budget is None:
+        return TILED_MIN_CELLS
+    return max(memory_budget // CELL_BYTES, 1)
+
+
+def tile_windows(shape: Tuple[int, int], tile_size: int = TILE_SIZE) -> List[Tuple[slice, slice]]:
+    """Windows (rows, cols) of tiles covering a grid"""
+    rows, cols = shape
+    return [
+        (slice(row, min(row + tile_size, rows)), slice(col, min(col + tile_size, cols)))
+        for row in range(0, rows, tile_size)
+        for col in range(0, cols, tile_size)
+    ]
+
+
+def _tile_box(affine: Affine, window: Tuple[slice, slice]) -> shapely.Geometry:
+    rows, cols = window
+    x0, y0 = affine * (cols.start, rows.start)
+    x1, y1 = affine * (cols.stop, rows.stop)
+    return shapely.box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+
+def _owner_tiles(geometries: GeoSeries, affine: Affine, shape: Tuple[int, int], tile_size: int) -> ndarray:
+    """Tile index of every geometry within one tile, -1 for geometries spanning tiles"""
+    # cell windows of geometry bounds, like geometry_window without margin
+    xmin, ymin, xmax, ymax = geometries.bounds.to_numpy().T
+    with np.errstate(invalid="ignore"):
+        row_range = np.sort([(ymax - affine.f) / affine.e, (ymin - affine.f) / affine.e], axis=0)
+        col_range = np.sort([(xmin - affine.c) / affine.a, (xmax - affine.c) / affine.a], axis=0)
+        row_start = np.maximum(np.floor(row_range[0]), 0)
+        row_stop = np.minimum(np.floor(row_range[1]) + 1, shape[0])
+        col_start = np.maximum(np.floor(col_range[0]), 0)
+        col_stop = np.minimum(np.floor(col_range[1]) + 1, shape[1])
+        has_cells = (row_stop > row_start) & (col_stop > col_start)
+
+    tile_row, tile_col = row_start // tile_size, col_start // tile_size
+    within_tile = has_cells & ((row_stop - 1) // tile_size == tile_row) & ((col_stop - 1) // tile_size == tile_col)
+    tiles_per_row = -(-shape[1] // tile_size)
+    return np.where(within_tile, tile_row * tiles_per_row + tile_col, -1).astype(np.int64)
+
+
+def _csr(cells: List[ndarray]) -> Tuple[ndarray, ndarray]:
+    """Return indptr and indices of groups of cells."""
+    indptr = np.concatenate([[0], np.cumsum([len(i) for i in cells])]).astype(np.int64)
+    indices = np.concatenate(cells) if cells else np.array([], dtype=np.int64)
+    return indptr, indices
+
+
+def _sample_tile(
+    values: ndarray,
+    geometries: GeoSeries,
+    geometry_indices: ndarray,
+    owners: ndarray,
+    tile: int,
+    window: Tuple[slice, slice],
+    affine: Affine,
+    nodata: Union[float, None],
+    stats: List[str],
+) -> Tuple[ndarray, ndarray, Dict[int, ndarray]]:
+    """Statistics of geometries within the tile and cell values of geometries spanning it"""
+    tile_values = values[:, window[0], window[1]]
+    tile_affine = window_transform(affine, window)
+    tile_shape = tile_values.shape[1:]
+    tile_values = tile_values.reshape(len(values), -1)
+
+    within, within_cells, partials = [], [], {}
+    for i in geometry_indices:
+        if owners[i] not in (tile, -1):  # sampled by its own tile
+            continue
+        cells = _geometry_cells(geometries.iloc[i], tile_affine, tile_shape)
+        if owners[i] == tile:
+            within.append(i)
+            within_cells.append(cells)
+        else:
+            partials[i] = tile_values[:, cells]
+
+    indptr, indices = _csr(within_cells)
+    result = grouped_stats(tile_values, indptr, indices, nodata=nodata, stats=stats)
+    return np.array(within, dtype=np.int64), result, partials
+
+
+def sample_tiled(
+    values: ndarray,
+    geometries: Union[List, GeoSeries],
+    affine: Affine,
+    nodata: Union[float, None],
+    stats: Union[str, List[str]] = "mean",
+    tile_size: int = TILE_SIZE,
+    n_workers: int = 1,
+) -> ndarray:
+    """Sample a stack of grids with shape (time, rows, cols) over a large set of geometries
+    tile by tile, with the same results as rasterstats
+
+    Parameters
+    ----------
+    values : ndarray
+        Array with shape (time, rows, cols)
+    geometries : Union[List, GeoSeries]
+        geometries to sample
+    affine : Affine
+        Affine transform of the grid
+    nodata : float or None
+        Cells with this value, or NaN, are ignored
+    stats : Union[str, List[str]]
+        Statistics to compute, see wiwb.zonal.grouped_stats
+    tile_size : int, optional
+        Number of rows and cols of a tile, by default 512
+    n_workers : int, optional
+        Number of threads to sample tiles in parallel, by default 1
+
+    Returns
+    -------
+    ndarray
+        Array with shape (time, geometries, stats)
+    """
+    if isinstance(stats, str):
+        stats = [stats]
+    if not isinstance(geometries, GeoSeries):
+        geometries = GeoSeries(geometries)
+
+    shape = values.shape[1:]
+    windows = tile_windows(shape, tile_size)
+    owners = _owner_tiles(geometries, affine, shape, tile_size)
+
+    # (tile, geometry) pairs of intersecting tiles and geometries
+    tree = shapely.STRtree(geometries.values)
+    tile_indices, geometry_indices = tree.query(
+        [_tile_box(affine, window) for window in windows], predicate="intersects"
+    )
+    order = np.argsort(tile_indices, kind="stable")
+    tile_indices, geometry_indices = tile_indices[order], geometry_indices[order]
+    tiles = np.unique(tile_indices)
+    splits = np.split(geometry_indices, np.searchsorted(tile_indices, tiles[1:]))
+
+    def sample_tile(args):
+        tile, indices = args
+        return _sample_tile(values, geometries, indices, owners, tile, windows[tile], affine, nodata, stats)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        tile_results = list(executor.map(sample_tile, zip(tiles, splits)))
+
+    # geometries without cells get the statistics of no cells
+    result = grouped_stats(
+        np.empty((len(values), 0)),
+        np.zeros(len(geometries) + 1, dtype=np.int64),
+        np.array([], dtype=np.int64),
+        nodata=nodata,
+        stats=stats,
+    )
+    partials: Dict[int, List[ndarray]] = {}
+    for within, tile_result, tile_partials in tile_results:
+        result[:, within] = tile_result
+        for i, value in tile_partials.items():
+            partials.setdefault(i, []).append(value)
+
+    # merge partials of geometries spanning tiles
+    if partials:
+        spanning = np.array(list(partials), dtype=np.int64)
+        spanning_values = np.concatenate([j for i in partials.values() for j in i], axis=1)
+        indptr = np.concatenate([[0], np.cumsum([sum(j.shape[1] for j in i) for i in partials.values()])]).astype(
+            np.int64
+        )
+        result[:, spanning] = grouped_stats(spanning_values, indptr, np.arange(indptr[-1]), nodata=nodata, stats=stats)
+
+    # like rasterstats, count cells outside the grid as nodata
+    if "nodata" in stats:
+        result[:, :, stats.index("nodata")] += outside_cells(geometries, affine, shape)
+
+    return result
@@ -0,0 +1,468 @@
+"""Zonal statistics on grids with geometry masks computed once per grid transform"""
+
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Tuple, Union
+
+import numpy as np
+from affine import Affine
+from geopandas import GeoSeries
+from numpy import ndarray
+from rasterio import features
+from scipy import sparse
+from shapely import wkb
+
+LINEAR_STATS = ["count", "sum", "mean"]
+CELL_STATS = LINEAR_STATS + ["min", "max", "std", "median", "majority", "minority", "unique", "range", "nodata", "nan"]
+POINT_STATS = LINEAR_STATS + ["min", "max", "median", "majority", "minority", "std", "range", "unique"]
+
+
+def is_point_stat(stat: str) -> bool:
+    """Check if a statistic can be sampled on points by a cell lookup."""
+    return (stat in POINT_STATS) or stat.startswith("percentile_")
+
+
+def _geometry_cells(geometry, affine: Affine, shape: Tuple[int, int]) -> ndarray:
+    """Flat cell indices of a grid covered by a geometry, following rasterstats rules.
+
+    Points cover the cell they fall in, other geometries cover all cells with their
+    center inside the geometry. Cells outside the grid are dropped.
+    """
+    rows, cols = shape
+    if geometry.geom_type == "Point":
+        col, row = ~affine * (geometry.x, geometry.y)
+        row, col = math.floor(row), math.floor(col)
+        if (0 <= row < rows) and (0 <= col < cols):
+            return np.array([row * cols + col], dtype=np.int64)
+        return np.array([], dtype=np.int64)
+
+    # full-cover window of geometry bounds, clipped to the grid
+    xmin, ymin, xmax, ymax = geometry.bounds
+    row_range = sorted(((ymax - affine.f) / affine.e, (ymin - affine.f) / affine.e))
+    col_range = sorted(((xmin - affine.c) / affine.a, (xmax - affine.c) / affine.a))
+    row_start, row_stop = max(math.floor(row_range[0]), 0), min(math.ceil(row_range[1]), rows)
+    col_start, col_stop = max(math.floor(col_range[0]), 0), min(math.ceil(col_range[1]), cols)
+    if (row_stop <= row_start) or (col_stop <= col_start):
+        return np.array([], dtype=np.int64)
+
+    window_affine = affine * Affine.translation(col_start, row_start)
+    mask = features.rasterize(
+        [(geometry, 1)],
+        out_shape=(row_stop - row_start, col_stop - col_start),
+        transform=window_affine,
+        fill=0,
+        dtype="uint8",
+    ).astype(bool)
+    window_rows, window_cols = np.nonzero(mask)
+    return (window_rows + row_start) * cols + (window_cols + col_start)
+
+
+def _outside_cells(geometry, affine: Affine, shape: Tuple[int, int]) -> int:
+    """Count the cells covered by a geometry outside the grid.
+
+    rasterstats counts these as nodata.
+    """
+    rows, cols = shape
+    if geometry.geom_type == "Point":
+        col, row = ~affine * (geometry.x, geometry.y)
+        return int(not ((0 <= math.floor(row) < rows) and (0 <= math.floor(col) < cols)))
+
+    xmin, ymin, xmax, ymax = geometry.bounds
+    row_range = sorted(((ymax - affine.f) / affine.e, (ymin - affine.f) / affine.e))
+    col_range = sorted(((xmin - affine.c) / affine.a, (xmax - affine.c) / affine.a))
+    row_start, row_stop = math.floor(row_range[0]), math.ceil(row_range[1])
+    col_start, col_stop = math.floor(col_range[0]), math.ceil(col_range[1])
+    if (row_start >= 0) and (col_start >= 0) and (row_stop <= rows) and (col_stop <= cols):
+        return 0
+
+    mask = features.rasterize(
+        [(geometry, 1)],
+        out_shape=(row_stop - row_start, col_stop - col_start),
+        transform=affine * Affine.translation(col_start, row_start),
+        fill=0,
+        dtype="uint8",
+    ).astype(bool)
+    mask[
+        max(-row_start, 0) : max(rows - row_start, 0),
+        max(-col_start, 0) : max(cols - col_start, 0),
+    ] = False
+    return int(mask.sum())
+
+
+def outside_cells(geometries: Union[List, GeoSeries], affine: Affine, shape: Tuple[int, int]) -> ndarray:
+    """Count the cells covered by every geometry outside the grid.
+
+    rasterstats counts these as nodata.
+    """
+    return np.array([_outside_cells(geometry, affine, shape) for geometry in geometries], dtype=np.int64)
+
+
+def geometry_window(
+    geometries: Union[List, GeoSeries],
+    affine: Affine,
+    shape: Tuple[int, int],
+    margin: int = 1,
+) -> Union[Tuple[slice, slice], None]:
+    """Window (rows, cols) of a grid covering the bounds of geometries plus margin cells.
+
+    Returns None if geometries are empty or don't overlap the grid.
+    """
+    if not isinstance(geometries, GeoSeries):
+        geometries = GeoSeries(geometries)
+    xmin, ymin, xmax, ymax = geometries.total_bounds
+    if not np.isfinite([xmin, ymin, xmax, ymax]).all():
+        return None
+
+    rows, cols = shape
+    row_range = sorted(((ymax - affine.f) / affine.e, (ymin - affine.f) / affine.e))
+    col_range = sorted(((xmin - affine.c) / affine.a, (xmax - affine.c) / affine.a))
+    row_start = max(math.floor(row_range[0]) - margin, 0)
+    row_stop = min(math.floor(row_range[1]) + 1 + margin, rows)
+    col_start = max(math.floor(col_range[0]) - margin, 0)
+    col_stop = min(math.floor(col_range[1]) + 1 + margin, cols)
+    if (row_stop <= row_start) or (col_stop <= col_start):
+        return None
+    return slice(row_start, row_stop), slice(col_start, col_stop)
+
+
+def window_transform(affine: Affine, window: Tuple[slice, slice]) -> Affine:
+    """Affine transform of a window (rows, cols) of a grid"""
+    rows, cols = window
+    return affine * Affine.translation(cols.start, rows.start)
+
+
+@dataclass
+class ZonalWeights:
+    """Sparse (geometry x cell) membership matrix of geometries on a grid.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.csr_matrix
+        Matrix with shape (number of geometries, number of grid cells), 1 where a cell is
+        part of a geometry
+    affine : Affine
+        Affine transform of the grid
+    shape : Tuple[int, int]
+        Shape (rows, cols) of the grid
+    """
+
+    matrix: sparse.csr_matrix
+    affine: Affine
+    shape: Tuple[int, int]
+
+    @classmethod
+    def from_geometries(
+        cls,
+        geometries: Union[List, GeoSeries],
+        affine: Affine,
+        shape: Tuple[int, int],
+    ) -> "ZonalWeights":
+        """Rasterize geometries once into a sparse membership matrix."""
+        cells = [_geometry_cells(geometry, affine, shape) for geometry in geometries]
+        indptr = np.concatenate([[0], np.cumsum([len(i) for i in cells])])
+        indices = np.concatenate(cells) if cells else np.array([], dtype=np.int64)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(cells), shape[0] * shape[1]),
+        )
+        return cls(matrix=matrix, affine=affine, shape=tuple(shape))
+
+    def sample(
+        self,
+        values: ndarray,
+        nodata: Union[float, None],
+        stats: Union[str, List[str]] = "mean",
+    ) -> ndarray:
+        """Compute linear statistics for all timesteps in one sparse matrix product.
+
+        Parameters
+        ----------
+        values : ndarray
+            Array with shape (time, rows, cols)
+        nodata : float or None
+            Cells with this value, or NaN, are ignored
+        stats : Union[str, List[str]]
+            Statistics in LINEAR_STATS to compute
+
+        Returns
+        -------
+        ndarray
+            Array with shape (time, geometries, stats). Geometries without valid cells
+            get NaN, except for count which is 0.
+        """
+        if isinstance(stats, str):
+            stats = [stats]
+        for stat in stats:
+            if stat not in LINEAR_STATS:
+                raise ValueError(f"{stat} not a linear statistic: {LINEAR_STATS}")
+
+        values = values.reshape(values.shape[0], self.shape[0] * self.shape[1])
+        valid = ~np.isnan(values) if np.issubdtype(values.dtype, np.floating) else True
+        if nodata is not None:
+            valid = valid & (values != nodata)
+        valid = np.broadcast_to(valid, values.shape)
+
+        count = (self.matrix @ valid.T.astype(np.float64)).T
+        total = (self.matrix @ np.where(valid, values, 0).T.astype(np.float64)).T
+        empty = count == 0
+
+        result = {
+            "count": count,
+            "sum": np.where(empty, np.nan, total),
+            "mean": np.divide(total, count, out=np.full_like(total, np.nan), where=~empty),
+        }
+        return np.stack([result[stat] for stat in stats], axis=-1)
+
+
+def point_cells(geometries: GeoSeries, affine: Affine, shape: Tuple[int, int]) -> Tuple[ndarray, ndarray, ndarray]:
+    """Row and column indices of the cells points fall in.
+
+    Returns
+    -------
+    Tuple[ndarray, ndarray, ndarray]
+        rows, cols and a boolean array that is False for points outside the grid
+    """
+    inverse = ~affine
+    xs, ys = geometries.x.to_numpy(), geometries.y.to_numpy()
+    cols = np.floor(inverse.a * xs + inverse.b * ys + inverse.c).astype(np.int64)
+    rows = np.floor(inverse.d * xs + inverse.e * ys + inverse.f).astype(np.int64)
+    inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+    return rows, cols, inside
+
+
+def sample_points(
+    values: ndarray,
+    geometries: GeoSeries,
+    affine: Affine,
+    nodata: Union[float, None],
+    stats: Union[str, List[str]] = "mean",
+) -> ndarray:
+    """Sample full time series of points with one gather on a (time, rows, cols) array.
+
+    Points outside the grid, or on nodata cells, get NaN (count 0).
+
+    Returns
+    -------
+    ndarray
+        Array with shape (time, points, stats)
+    """
+    if isinstance(stats, str):
+        stats = [stats]
+
+    rows, cols, inside = point_cells(geometries, affine, values.shape[1:])
+    samples = np.full((values.shape[0], len(geometries)), np.nan)
+    samples[:, inside] = values[:, rows[inside], cols[inside]]
+    if nodata is not None:
+        samples[samples == nodata] = np.nan
+    valid = ~np.isnan(samples)
+
+    result = []
+    for stat in stats:
+        if stat == "count":
+            result.append(valid.astype(float))
+        elif stat in ["std", "range"]:
+            result.append(np.where(valid, 0.0, np.nan))
+        elif stat == "unique":
+            result.append(np.where(valid, 1.0, np.nan))
+        elif is_point_stat(stat):
+            result.append(samples)
+        else:
+            raise ValueError(f"{stat} can not be sampled on points, choose from {POINT_STATS} or percentile_#")
+
+    return np.stack(result, axis=-1)
+
+
+def _percentile(stat: str) -> float:
+    try:
+        q = float(stat[len("percentile_") :])
+    except ValueError:
+        raise ValueError(f"{stat} is not a valid percentile, use percentile_# with # a number")
+    if not 0 <= q <= 100:
+        raise ValueError(f"{stat} is not a valid percentile, # in percentile_# should be in [0, 100]")
+    return q
+
+
+ORDER_STATS = ["median", "majority", "minority", "unique"]
+
+
+def _lerp(a: ndarray, b: ndarray, t: ndarray) -> ndarray:
+    # linear interpolation exactly as numpy.percentile does
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def grouped_stats(
+    values: ndarray,
+    indptr: ndarray,
+    indices: ndarray,
+    nodata: Union[float, None],
+    stats: Union[str, List[str]] = "mean",
+) -> ndarray:
+    """Compute statistics over groups of cells, like geometries, for all timesteps in one
+    pass, following rasterstats rules.
+
+    Group i consists of cells indices[indptr[i]:indptr[i + 1]], like the rows of a CSR
+    matrix. Cells with nodata, or NaN, are ignored. Without valid cells all statistics but
+    count (0), nodata and nan are NaN. Order statistics (median, percentile_#, majority,
+    minority, unique) share one sort of the cells of all groups and timesteps.
+
+    Parameters
+    ----------
+    values : ndarray
+        Array with shape (time, cells)
+    indptr : ndarray
+        Start of every group in indices, and the end of the last group
+    indices : ndarray
+        Cell indices of all groups
+    nodata : float or None
+        Cells with this value, or NaN, are ignored
+    stats : Union[str, List[str]]
+        Any rasterstats statistic: count, sum, mean, min, max, std, median, majority,
+        minority, unique, range, nodata, nan or percentile_#
+
+    Returns
+    -------
+    ndarray
+        Array with shape (time, groups, stats)
+    """
+    if isinstance(stats, str):
+        stats = [stats]
+    for stat in stats:
+        if stat.startswith("percentile_"):
+            _percentile(stat)
+        elif stat not in CELL_STATS:
+            raise ValueError(f"{stat} is not a valid statistic, choose from {CELL_STATS} or percentile_#")
+
+    n_times, n_groups = len(values), len(indptr) - 1
+    result = np.full((n_times, n_groups, len(stats)), np.nan)
+    sizes = np.diff(indptr)
+    if len(indices) == 0:
+        for i, stat in enumerate(stats):
+            if stat in ["count", "nodata", "nan"]:
+                result[:, :, i] = 0
+        return result
+
+    # cells of all groups, group after group
+    cells = values[:, indices]
+    is_nan = np.isnan(cells) if np.issubdtype(cells.dtype, np.floating) else np.zeros(cells.shape, dtype=bool)
+    is_nodata = (cells == nodata) if nodata is not None else np.zeros(cells.shape, dtype=bool)
+    valid = ~(is_nan | is_nodata)
+    masked = np.where(valid, cells, np.nan).astype(float)
+    groups = np.repeat(np.arange(n_groups), sizes)
+    non_empty = sizes > 0
+    starts = np.minimum(indptr[:-1], len(indices) - 1)  # to index cells of non-empty groups
+
+    def group_reduce(ufunc: np.ufunc, x: ndarray) -> ndarray:
+        result = np.zeros((n_times, n_groups), dtype=x.dtype)
+        result[:, non_empty] = ufunc.reduceat(x, indptr[:-1][non_empty], axis=1)
+        return result
+
+    def group_sum(x: ndarray) -> ndarray:
+        return group_reduce(np.add, x)
+
+    count = group_sum(valid.astype(np.int64))
+    filled = count > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = group_sum(np.where(valid, masked, 0))
+        mean = total / count
+
+    # sort cells of every group and timestep, NaN last
+    if any((i in ORDER_STATS) or i.startswith("percentile_") for i in stats):
+        order = np.lexsort((masked, np.broadcast_to(groups, masked.shape)), axis=-1)
+        ordered = np.take_along_axis(masked, order, axis=1)
+        rows = np.arange(n_times)[:, np.newaxis]
+        last = np.maximum(count - 1, 0)
+
+        def quantile(q: float) -> ndarray:
+            position = last * (q / 100)
+            previous = np.floor(position).astype(np.int64)
+            following = np.minimum(previous + 1, last)
+            return _lerp(
+                ordered[rows, starts + previous],
+                ordered[rows, starts + following],
+                position - previous,
+            )
+
+    if any(i in ["majority", "minority", "unique"] for i in stats):
+        # runs of equal values within a group and timestep
+        is_value = ~np.isnan(ordered)
+        new_value = np.ones(ordered.shape, dtype=bool)
+        new_value[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+        new_group = np.ones(len(groups), dtype=bool)
+        new_group[1:] = groups[1:] != groups[:-1]
+        run_start = (is_value & (new_value | new_group)).ravel()
+        run_ids = np.cumsum(run_start) - 1
+        run_lengths = np.bincount(run_ids[is_value.ravel()], minlength=run_start.sum())
+        run_groups = (rows * n_groups + groups).ravel()[run_start]
+        run_values = ordered.ravel()[run_start]
+
+        def select_runs(key: ndarray) -> ndarray:
+            # value of the first run with the lowest key per group, the smallest on ties
+            order = np.lexsort((key, run_groups))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = run_groups[order][1:] != run_groups[order][:-1]
+            result = np.full(n_times * n_groups, np.nan)
+            result[run_groups[order][first]] = run_values[order][first]
+            return result.reshape(n_times, n_groups)
+
+    for i, stat in enumerate(stats):
+        if stat == "count":
+            result[:, :, i] = count
+            continue
+        elif stat == "nodata":
+            result[:, :, i] = group_sum(is_nodata.astype(np.int64))
+            continue
+        elif stat == "nan":
+            result[:, :, i] = group_sum(is_nan.astype(np.int64))
+            continue
+        elif stat == "sum":
+            value = total
+        elif stat == "mean":
+            value = mean
+        elif stat == "min":
+            value = group_reduce(np.fmin, masked)
+        elif stat == "max":
+            value = group_reduce(np.fmax, masked)
+        elif stat == "range":
+            value = group_reduce(np.fmax, masked) - group_reduce(np.fmin, masked)
+        elif stat == "std":
+            deviation = np.where(valid, masked - mean[:, groups], 0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                value = np.sqrt(group_sum(deviation**2) / count)
+        elif stat == "median":
+            # mean of the middle values, as numpy.median
+            value = (ordered[rows, starts + last // 2] + ordered[rows, starts + (last + 1) // 2]) / 2
+        elif stat.startswith("percentile_"):
+            value = quantile(_percentile(stat))
+        elif stat == "majority":
+            value = select_runs(-run_lengths)
+        elif stat == "minority":
+            value = select_runs(run_lengths)
+        else:  # unique
+            value = np.bincount(run_groups, minlength=n_times * n_groups).reshape(n_times, n_groups)
+        result[:, :, i] = np.where(filled, value, np.nan)
+
+    return result
+
+
+@lru_cache(maxsize=16)
+def _cached_weights(geometries_wkb: Tuple[bytes], affine: Tuple[float], shape: Tuple[int, int]) -> ZonalWeights:
+    geometries = [wkb.loads(i) for i in geometries_wkb]
+    return ZonalWeights.from_geometries(geometries, Affine(*affine[:6]), shape)
+
+
+def get_zonal_weights(
+    geometries: Union[List, GeoSeries],
+    affine: Affine,
+    shape: Tuple[int, int],
+) -> ZonalWeights:
+    """Get ZonalWeights for geometries on a grid, re-using earlier rasterizations of the same grid."""
+    if not isinstance(geometries, GeoSeries):
+        geometries = GeoSeries(geometries)
+    return _cached_weights(tuple(geometries.to_wkb()), tuple(affine)[:6], tuple(shape))
+
+
+def clear_weights_cache() -> None:
+    """Clear the ZonalWeights cached by get_zonal_weights."""
+    _cached_weights.cache_clear()